@@ -0,0 +1,116 @@
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from ifqi import envs
+from ifqi.envs.integrators import LSODA, select_integrator
+from ifqi.evaluation import evaluation
+
+"""
+Benchmark of the integrators of the dynamics of Acrobot and CarOnHill. The
+state-actions of random-policy episodes are integrated over one time step
+by each integrator, one at a time as in step ('single') and, for the
+vectorized integrators, all at once as in step_batch ('batch'); the error
+is measured against odeint with tolerances 1e-11. The trajectory error is
+the median, over episodes, of the distance from the reference after
+TRAJECTORY_STEPS steps with the same random actions, starting from reset
+states.
+
+Results obtained on a single core (50 episodes: 5000 transitions of
+Acrobot, 3456 of CarOnHill; 'single' and 'batch' are in steps/s, 'err
+med' and 'err max' are the median and maximum errors, 'div.' counts the
+non-finite results, which are left out of the errors, and 'traj.' is the
+trajectory error; lsoda is the default integrator of step):
+
+    env        integrator single    batch  err med  err max  div.    traj.
+    Acrobot    lsoda        1389        -  5.5e-05  1.3e+01     0  7.5e-04
+    Acrobot    lsoda_jac    1301        -  5.5e-05  1.3e+01     0  7.5e-04
+    Acrobot    dopri5        236     9464  3.5e-05  8.5e-01     0  3.5e-03
+    Acrobot    rk4           506   111726  1.5e-06  1.9e+95   151  1.5e-04
+    Acrobot    euler        2017   549136  7.8e-02 1.2e+138    46  2.5e+00
+    CarOnHill  lsoda        5590        -  2.4e-08  3.8e-07     0  1.6e-07
+    CarOnHill  lsoda_jac    7182        -  2.4e-08  3.8e-07     0  1.6e-07
+    CarOnHill  dopri5        475    73456  3.4e-09  9.6e-06     0  6.6e-08
+    CarOnHill  rk4           493   319024  1.4e-08  9.7e-03     0  1.1e-07
+    CarOnHill  euler        1692  1717682  4.4e-03  6.5e-02     0  5.7e-03
+
+The fixed-step integrators are the fastest in batch, but on Acrobot they
+diverge on the states with very high velocities, where the dynamics are
+stiff, and on CarOnHill they lose accuracy where the acceleration is
+discontinuous (position 0). dopri5 keeps the accuracy of lsoda and is used
+by step_batch; for single steps lsoda remains the fastest, and the analytic
+Jacobian gives no consistent gain on these small systems.
+"""
+
+N_EPISODES = 50
+TRAJECTORY_STEPS = 20
+N_TRAJECTORIES = 20
+INTEGRATORS = ['lsoda', 'lsoda_jac', 'dopri5', 'rk4', 'euler']
+
+
+def distance(x, y):
+    with np.errstate(invalid='ignore', over='ignore'):
+        d = np.sqrt(((x - y) ** 2).sum(axis=1))
+    return np.where(np.isfinite(d), d, np.nan)
+
+
+def trajectories(mdp, integrator, initial_states, actions):
+    x = np.column_stack((initial_states, actions[:, 0]))
+    with np.errstate(all='ignore'):
+        for t in range(actions.shape[1]):
+            x[:, -1] = actions[:, t]
+            x = integrator.integrate(mdp._ode, x, mdp._dt)
+
+    return x[:, :-1]
+
+
+def run(env_class):
+    mdp = env_class()
+    mdp.seed(0)
+    np.random.seed(0)
+    state_dim, action_dim, _ = envs.get_space_info(mdp)
+    dataset = evaluation.collect_episodes(mdp, n_episodes=N_EPISODES)
+    sa = dataset[:, :state_dim + action_dim]
+
+    reference = LSODA(rtol=1e-11, atol=1e-11, mxstep=50000)
+    x_ref = reference.integrate(mdp._ode, sa, mdp._dt)
+
+    rng = np.random.RandomState(0)
+    initial_states = np.array([mdp.reset() for _ in range(N_TRAJECTORIES)])
+    actions = rng.choice(mdp.action_space.values.ravel(),
+                         (N_TRAJECTORIES, TRAJECTORY_STEPS))
+    t_ref = trajectories(mdp, reference, initial_states, actions)
+
+    # the tolerances of the environments
+    tolerances = {'rtol': 1e-5, 'atol': 1e-5, 'mxstep': 2000} \
+        if env_class is envs.Acrobot else {}
+    for name in INTEGRATORS:
+        integrator = select_integrator(name, **tolerances)
+        n_single = 2000
+        start = time.time()
+        with np.errstate(all='ignore'):
+            for y in sa[:n_single]:
+                integrator.integrate(mdp._ode, y[np.newaxis], mdp._dt)
+        single = n_single / (time.time() - start)
+
+        start = time.time()
+        with np.errstate(all='ignore'):
+            x = integrator.integrate(mdp._ode, sa, mdp._dt)
+        batch = sa.shape[0] / (time.time() - start)
+
+        error = distance(x, x_ref)
+        t_error = distance(trajectories(mdp, integrator, initial_states,
+                                        actions), t_ref)
+        print('{:<10} {:<10} {:>6.0f} {:>8} {:>8.1e} {:>8.1e} {:>5d} '
+              '{:>8.1e}'.format(env_class.__name__, name, single,
+                                 '{:.0f}'.format(batch)
+                                 if integrator.vectorized else '-',
+                                 np.nanmedian(error), np.nanmax(error),
+                                 int(np.isnan(error).sum()),
+                                 np.nanmedian(t_error)))
+
+
+if __name__ == '__main__':
+    for env_class in [envs.Acrobot, envs.CarOnHill]:
+        run(env_class)
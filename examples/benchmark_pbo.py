@@ -0,0 +1,165 @@
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from ifqi import envs
+from ifqi.algorithms.pbo.PBO import PBO
+from ifqi.evaluation import evaluation
+from ifqi.models.regressor import Regressor
+
+"""
+Convergence of the PBO backends on LQG1D. The Q-function is quadratic,
+Q(s, a) = w0 s^2 + w1 s a + w2 a^2 + w3, so the projected Bellman
+iteration (each theta is the least-squares fit of the targets of the
+previous one) has a fixed point, which is computed exactly and used as the
+reference; its greedy policy is a = K s with K = -w1 / (2 w2), close to the
+optimal controller of the LQG. The transitions come from a stabilizing
+noisy behaviour policy: the episodes of a random policy reach states of
+hundreds, where the clipping of the actions makes the Q-function far from
+quadratic and the projected iteration diverges whatever the optimizer
+(this is also the case of the two-parameter Q-function of
+simple_run_pbo.py).
+
+Each fit is counted as converged when the quadratic weights are within 1%
+of the reference. An objective evaluation is the Bellman loss of one theta
+on one minibatch of BATCH_SIZE transitions: Adam evaluates it (with its
+gradient) n_steps times per fit, NES once per candidate.
+
+Results obtained on a single core (100 episodes, 10000 transitions,
+default parameters of the backends, batch_size=256, seed 0; K* = -0.6153):
+
+    optimizer  fits  evaluations  time [s]   rel. error      K
+    adam          7          350      0.05       0.0088 -0.6200
+    nes           -        30626    225.70       0.9253 -0.0983
+
+Adam reaches the fixed point in 5-7 fits on the dataset seeds 0-4, and
+stays within about 5% of it afterwards (the minibatches are resampled at
+each step). NES is run for NES_FITS fits only: its first fit, on the 274
+weights of the operator, stops with a numerical instability after about
+30000 evaluations, still far from the fixed point.
+"""
+
+N_EPISODES = 100
+BATCH_SIZE = 256
+MAX_FITS = 100
+NES_FITS = 1
+TOLERANCE = 0.01
+
+
+class QuadraticQ(object):
+    # predict accepts f_rhos, see Regressor.has_population_predict
+    population_predict = True
+
+    def __init__(self, theta):
+        self.theta = theta
+
+    def _features(self, sa):
+        s, a = sa[:, 0], sa[:, 1]
+        return np.column_stack((s ** 2, s * a, a ** 2, np.ones_like(s)))
+
+    def predict(self, sa, **opt_pars):
+        if 'f_rhos' in opt_pars:
+            # one row of Q-values for each theta
+            return opt_pars['f_rhos'].dot(self._features(sa).T)
+        return self._features(sa).dot(opt_pars.get('f_rho', self.theta))
+
+    def gradient(self, sa, **opt_pars):
+        return self._features(sa)
+
+    def max_action(self, states, low, high, **opt_pars):
+        # maximum at the stationary point (if concave) or at one of the
+        # bounds
+        w = opt_pars.get('f_rho', self.theta)
+        s = states[:, 0]
+        candidates = [np.ones_like(s) * low, np.ones_like(s) * high]
+        if w[2] < 0:
+            candidates.append(np.clip(-w[1] * s / (2 * w[2]), low, high))
+        A = np.column_stack(candidates)
+        S = s[:, np.newaxis]
+        Q = w[0] * S ** 2 + w[1] * S * A + w[2] * A ** 2 + w[3]
+        best = np.argmax(Q, axis=1)
+        rows = np.arange(s.shape[0])
+
+        return Q[rows, best], A[rows, best]
+
+
+class NoisyLinearPolicy(object):
+    def __init__(self, k=-0.5, noise=3., seed=None):
+        self.k = k
+        self.noise = noise
+        self._rng = np.random.RandomState(seed)
+
+    def draw_action(self, state, absorbing, evaluation=False):
+        noise = self._rng.uniform(-self.noise, self.noise, np.shape(state))
+        return np.clip(self.k * state + noise, -8, 8)
+
+
+def fixed_point(mdp, sast, r, n_iterations=5000):
+    q = QuadraticQ(None)
+    X = q._features(sast[:, :2])
+    theta = np.zeros(4)
+    for _ in range(n_iterations):
+        maxQ, _ = q.max_action(sast[:, 2:3], -8, 8, f_rho=theta)
+        new_theta = np.linalg.lstsq(X, r + mdp.gamma * maxQ, rcond=None)[0]
+        if np.max(np.abs(new_theta - theta)) < 1e-10:
+            break
+        theta = new_theta
+
+    return new_theta
+
+
+def relative_error(theta, reference):
+    return np.max(np.abs(theta[:3] - reference[:3])) / \
+        np.max(np.abs(reference[:3]))
+
+
+def gain(theta):
+    return -theta[1] / (2 * theta[2])
+
+
+def run(mdp, sast, r, reference, optimizer, max_fits):
+    pbo = PBO(estimator=Regressor(QuadraticQ, theta=np.zeros(4)),
+              state_dim=1, action_dim=1,
+              discrete_actions=np.linspace(-8, 8, 33), gamma=mdp.gamma,
+              horizon=mdp.horizon, optimizer=optimizer,
+              batch_size=BATCH_SIZE, seed=0)
+    n_evaluations = 0
+    start = time.time()
+    for i in range(max_fits):
+        if i == 0:
+            theta, _ = pbo.fit(sast, r)
+        else:
+            theta, _ = pbo.fit()
+        if optimizer == 'adam':
+            n_evaluations += pbo._n_steps
+        else:
+            n_evaluations += pbo._optimizer.numEvaluations
+        if relative_error(theta, reference) < TOLERANCE:
+            break
+    elapsed = time.time() - start
+
+    converged = relative_error(theta, reference) < TOLERANCE
+    print('{:<10} {:>4} {:>12d} {:>9.2f} {:>12.4f} {:>7.4f}'.format(
+        optimizer, i + 1 if converged else '-', n_evaluations, elapsed,
+        relative_error(theta, reference), gain(theta)))
+
+
+if __name__ == '__main__':
+    mdp = envs.LQG1D()
+    mdp.seed(0)
+    np.random.seed(0)
+    dataset = evaluation.collect_episodes(mdp, NoisyLinearPolicy(seed=0),
+                                          n_episodes=N_EPISODES)
+    sast = np.append(dataset[:, :2], dataset[:, 3:-1], axis=1)
+    r = dataset[:, 2]
+
+    reference = fixed_point(mdp, sast, r)
+    print('K* = {:.4f}, K of the fixed point = {:.4f}'.format(
+        mdp.computeOptimalK().item(), gain(reference)))
+    print('optimizer  fits  evaluations  time [s]   rel. error      K')
+    run(mdp, sast, r, reference, 'adam', MAX_FITS)
+    try:
+        run(mdp, sast, r, reference, 'nes', NES_FITS)
+    except ImportError as e:
+        print('nes skipped:', e)
@@ -9,6 +9,7 @@ from sklearn.ensemble import ExtraTreesRegressor
 from ifqi.loadexperiment import get_MDP, get_model
 from ifqi import envs
 from ifqi.evaluation import evaluation
+from ifqi.evaluation.dataset import TransitionDataset
 from ifqi.algorithms.fqi.FQI import FQI
 from ifqi.models.actionregressor import ActionRegressor
 from ifqi.models.mlp import MLP
@@ -22,7 +23,8 @@ according to the required measure (e.g. dataset size or FQI steps).
 
 def evaluate(mdp, fqi, initial_states, args):
     values = evaluation.evaluate_policy(mdp, fqi,
-                                        initial_states=initial_states)
+                                        initial_states=initial_states,
+                                        lockstep=True)
     iteration_values = list()
     results = list()
     print('J: %f' % values[0])
@@ -67,7 +69,6 @@ mdp = get_MDP(config['mdp']['name'])
 mdp.set_seed(config['experiment_setting']['evaluation']['seed'])
 state_dim, action_dim, reward_dim = envs.get_space_info(mdp)
 assert reward_dim == 1
-reward_idx = state_dim + action_dim
 discrete_actions = mdp.action_space.values
 
 # Load model
@@ -95,8 +96,10 @@ fit_params = config['fit_params']
 # Load dataset
 dataset = evaluation.collect_episodes(
     mdp, n_episodes=config['experiment_setting']['evaluation']
-                          ['n_episodes'][-1])
+                          ['n_episodes'][-1], n_jobs=-1)
 print('Dataset has %d samples' % dataset.shape[0])
+transitions = TransitionDataset.from_array(dataset, state_dim, action_dim,
+                                           reward_dim)
 
 # Load initial state to start evaluation episodes. This is the only setting
 # to be chosen outside the configuration file.
@@ -114,25 +117,13 @@ results = list()
 if config['experiment_setting']['evaluation']['metric'] == 'n_episodes':
     for e in range(config['experiment_setting']['evaluation']['n_experiments']):
         for i in config['experiment_setting']['evaluation']['n_episodes']:
-            episode_end_idxs = np.argwhere(dataset[:, -1] == 1).ravel()
-            last_el = episode_end_idxs[i - 1]
-            sast = np.append(dataset[:last_el + 1, :reward_idx],
-                             dataset[:last_el + 1, reward_idx + 1:-1],
-                             axis=1)
-            r = dataset[:last_el + 1, reward_idx]
-
-            fqi.fit(sast, r, **fit_params)
+            fqi.fit(transitions.first_episodes(i), **fit_params)
 
             experiment_results.append(evaluate(mdp, fqi, initial_states, args))
         results.append(experiment_results)
 elif config['experiment_setting']['evaluation']['metric'] == 'fqi_iteration':
-    sast = np.append(dataset[:, :reward_idx],
-                     dataset[:, reward_idx + 1:-1],
-                     axis=1)
-    r = dataset[:, reward_idx]
-
     for e in range(config['experiment_setting']['evaluation']['n_experiments']):
-        fqi.partial_fit(sast, r, **fit_params)
+        fqi.partial_fit(transitions, **fit_params)
 
         for i in range(2, fqi.horizon + 1):
             fqi.partial_fit(None, None, **fit_params)
@@ -28,16 +28,43 @@ r = dataset[:, reward_idx]
 
 
 class LQG_Q():
+    # predict accepts f_rhos, see Regressor.has_population_predict
+    population_predict = True
+
     def __init__(self, theta):
         self.theta = theta
 
     def predict(self, sa, **opt_pars):
-        if 'f_rho' in opt_pars:
+        if 'f_rhos' in opt_pars:
+            # one row of Q-values for each theta
+            k, b = opt_pars['f_rhos'].T[:, :, np.newaxis]
+        elif 'f_rho' in opt_pars:
             k, b = opt_pars['f_rho']
         else:
             k, b = self.theta
         return b * sa[:, 1] ** 2 - (sa[:, 1] - k * sa[:, 0]) ** 2
 
+    def gradient(self, sa, **opt_pars):
+        # derivatives of the Q-values with respect to (k, b)
+        k, b = opt_pars.get('f_rho', self.theta)
+        return np.column_stack((2 * (sa[:, 1] - k * sa[:, 0]) * sa[:, 0],
+                                sa[:, 1] ** 2))
+
+    def max_action(self, states, low, high, **opt_pars):
+        # Q is quadratic in the action: its maximum over [low, high] is at
+        # the stationary point (if concave) or at one of the bounds
+        k, b = opt_pars.get('f_rho', self.theta)
+        s = states[:, 0]
+        candidates = [np.ones_like(s) * low, np.ones_like(s) * high]
+        if b < 1:
+            candidates.append(np.clip(k * s / (1 - b), low, high))
+        A = np.column_stack(candidates)
+        Q = b * A ** 2 - (A - k * s[:, np.newaxis]) ** 2
+        best = np.argmax(Q, axis=1)
+        rows = np.arange(s.shape[0])
+
+        return Q[rows, best], A[rows, best]
+
 theta = np.array([1., 0.])
 regressor_params = {'theta': theta}
 regressor = Regressor(LQG_Q, **regressor_params)
@@ -52,13 +79,20 @@ pbo = PBO(estimator=regressor,
           verbose=True)
 
 epsilon = 1e-5
+max_iterations = 100
 delta = np.inf
 
+# the projected Bellman iteration of this Q-function has no fixed point on
+# random-policy data (see benchmark_pbo.py), so the loop is bounded
 theta, _ = pbo.fit(sast, r)
-while delta > epsilon:
+iteration = 1
+while delta > epsilon and iteration < max_iterations:
     theta, delta = pbo.fit()
+    iteration += 1
 
     print('Delta theta:', delta)
+if delta > epsilon:
+    print('Not converged after', max_iterations, 'iterations')
 
 print(theta)
 
@@ -1,15 +1,22 @@
 from __future__ import print_function
+import itertools
+
 import numpy as np
 import sklearn.preprocessing as preprocessing
 from numpy.matlib import repmat
 
 from ifqi.preprocessors.features import select_features
 from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.compiledforest import compile_forest
 
 """
 Interface for algorithm.
 """
 
+# versions of the models of all the algorithms, never reused (see
+# Algorithm._new_version)
+_versions = itertools.count()
+
 
 class Algorithm(object):
     def __init__(self, estimator, state_dim, action_dim,
@@ -52,8 +59,11 @@ class Algorithm(object):
 
         self.__name__ = None
         self._iteration = 0
-        self._features = select_features(features)
+        self._features = select_features(features, action_dim)
         self._verbose = verbose
+        self._compiled = False
+        self._predictor = None
+        self._new_version()
 
     def _check_states(self, X):
         """
@@ -77,28 +87,50 @@ class Algorithm(object):
         Returns:
             Q: the maximum Q-value in each state
             A: the action associated to the max Q-value in each state
+        If the estimator has a max_action(states, low, high) method (enabled
+        by has_max_action()) returning the maximum Q-value and the maximizer
+        within the [low, high] range of the discrete actions, it is used
+        instead of enumerating the actions.
         """
         new_state = self._check_states(states)
         n_states = new_state.shape[0]
         n_actions = self._actions.shape[0]
 
+        # closed-form maximization over the range of the discrete actions
+        if self._features is None and \
+                hasattr(self._estimator, 'has_max_action') and \
+                self._estimator.has_max_action():
+            rQ, rA = self._estimator.max_action(
+                new_state, low=self._actions.min(axis=0),
+                high=self._actions.max(axis=0))
+            if self.action_dim == 1:
+                rA = np.ravel(rA)
+
+            return rQ * (1 - absorbing), rA
+
+        # the state features are computed once for all the actions
+        if self._features is not None:
+            new_state = self._features.state_features(new_state)
+
         Q = np.zeros((n_states, n_actions))
         for idx in range(n_actions):
             actions = np.matlib.repmat(self._actions[idx], n_states, 1)
 
             # concatenate [new_state, action] and scalarize them
-            samples = np.concatenate((new_state, actions), axis=1)
-
             if self._features is not None:
-                samples = self._features.test_features(samples)
+                samples = self._features.combine(new_state, actions)
+            else:
+                samples = np.concatenate((new_state, actions), axis=1)
 
             # predict Q-function
             if not evaluation and hasattr(self._estimator, 'has_ensembles') \
                and self._estimator.has_ensembles():
                 opt_pars = {'n_actions': n_actions, 'idx': idx}
+                predictions = self._estimator.predict(samples, **opt_pars)
+            elif evaluation and self._predictor is not None:
+                predictions = self._predictor.predict(samples)
             else:
-                opt_pars = dict()
-            predictions = self._estimator.predict(samples, **opt_pars)
+                predictions = self._estimator.predict(samples)
 
             Q[:, idx] = predictions * (1 - absorbing)
 
@@ -106,10 +138,10 @@ class Algorithm(object):
         amax = np.argmax(Q, axis=1)
 
         # store Q-value and action for each state
-        rQ, rA = np.zeros(n_states), np.zeros(n_states)
-        for idx in range(n_states):
-            rQ[idx] = Q[idx, amax[idx]]
-            rA[idx] = self._actions[amax[idx]]
+        rQ = Q[np.arange(n_states), amax]
+        rA = self._actions[amax]
+        if self.action_dim == 1:
+            rA = rA.ravel()
 
         return rQ, rA
 
@@ -132,14 +164,36 @@ class Algorithm(object):
 
         return maxa
 
+    def compile_estimator(self):
+        """
+        Compile the (tree-based) estimator into its array representation and
+        use it to predict the Q-function when evaluating the policy, where
+        few states are queried at a time and the per-tree overhead of the
+        estimator dominates. Once enabled, the compiled estimator is
+        refreshed after each fit.
+        """
+        self._compiled = True
+        self._predictor = compile_forest(self._estimator)
+        self._new_version()
+
     def reset(self):
         """
         Reset.
         """
         self._iteration = 0
+        self._predictor = None
+        self._new_version()
         self._sa = None
         self._r = None
         self._snext = None
         self._absorbing = None
-        self._features = None
-        self._verbose = None
+        if self._features is not None:
+            self._features.clear_cache()
+
+    def _new_version(self):
+        """
+        Mark the model as changed, giving it a version number that no model
+        had before, so that EvaluationPool sends it again to its processes.
+        Called whenever the model is fitted, compiled or reset.
+        """
+        self._version = next(_versions)
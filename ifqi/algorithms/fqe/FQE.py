@@ -0,0 +1,189 @@
+from __future__ import print_function
+import numpy as np
+
+from ifqi.algorithms.algorithm import Algorithm
+
+"""
+This class implements the functions to run Fitted Q Evaluation algorithm.
+"""
+
+
+class FQE(Algorithm):
+    """
+    Fitted Q Evaluation: estimate the Q-function of a given policy from a
+    dataset of transitions, with the iterations of FQI where the maximum
+    over the actions in the next state is replaced by the action of the
+    policy. The value of the policy in some initial states is then
+    obtained without running the environment.
+    """
+
+    def __init__(self, estimator, state_dim, action_dim,
+                 discrete_actions, gamma, horizon, policy,
+                 features=None, verbose=False):
+        """
+        Constructor.
+        Args:
+            estimator (object): the model of the Q-function of the policy,
+                                distinct from the one of the policy
+            state_dim (int): state dimensionality
+            action_dim (int): action dimensionality
+            discrete_actions (list, array): list of discrete actions
+            gamma (float): discount factor
+            horizon (int): horizon
+            policy (object): the policy to evaluate (method draw_action is
+                             expected); it is queried once per fit on all the
+                             next states of the dataset
+            features (object, None): kind of features to use
+            verbose (int, False): verbosity level
+        """
+        self.__name__ = 'FQE'
+        self.policy = policy
+        super(FQE, self).__init__(estimator, state_dim, action_dim,
+                                  discrete_actions, gamma, horizon,
+                                  features, verbose)
+
+    def partial_fit(self, sast=None, r=None, **kwargs):
+        """
+        Perform a step of FQE using input data sast and r. The actions of
+        the policy in the next states are computed when the dataset is
+        given, so the policy must not change until the next call with a
+        dataset.
+
+        Args:
+            sast (numpy.array, TransitionDataset, None): the input in the
+                dataset, or a TransitionDataset providing both the input and
+                the output
+            r (numpy.array, None): the output in the dataset
+            **kwargs: additional parameters to be provided to the fit function
+            of the estimator
+
+        Returns:
+            sa, y: the preprocessed input and output
+        """
+        if hasattr(sast, 'fqi_inputs'):
+            self._sa, self._snext, self._absorbing, rewards = \
+                sast.fqi_inputs()
+            if r is None:
+                r = rewards
+        elif sast is not None:
+            next_states_idx = self.state_dim + self.action_dim
+            self._sa = sast[:, :next_states_idx]
+            self._snext = sast[:, next_states_idx:-1]
+            self._absorbing = sast[:, -1]
+        if sast is not None:
+            if self._features is not None:
+                self._sa = self._features(self._sa)
+            self._next_actions = self._policy_actions(self._snext)
+        if r is not None:
+            self._r = r
+
+        if self._verbose > 0:
+            print('Iteration {}'.format(self._iteration + 1))
+
+        if self._iteration == 0:
+            y = self._r
+        else:
+            q = self._predict(self._snext, self._next_actions)
+            y = self._r + self.gamma * q * (1 - self._absorbing)
+
+            if hasattr(self._estimator, 'has_ensembles') \
+               and self._estimator.has_ensembles():
+                    # update estimator structure
+                    self._estimator.adapt(iteration=self._iteration)
+
+        self._estimator.fit(self._sa, y.ravel(), **kwargs)
+
+        self._iteration += 1
+        self._new_version()
+
+        return self._sa, y
+
+    def fit(self, sast, r=None, **kwargs):
+        """
+        Perform steps of FQE using input data sast and r.
+
+        Args:
+            sast (numpy.array, TransitionDataset): the input in the dataset,
+                or a TransitionDataset providing both the input and the output
+            r (numpy.array, None): the output in the dataset
+            **kwargs: additional parameters to be provided to the fit function
+                      of the estimator
+
+        Returns:
+            sa, y: the preprocessed input and output
+        """
+        if self._verbose > 0:
+            print("Starting complete run...")
+
+        # reset iteration count
+        self.reset()
+
+        # main loop
+        sa, y = self.partial_fit(sast, r, **kwargs)
+        for t in range(1, self.horizon):
+            sa, y = self.partial_fit(sast=None, r=None, **kwargs)
+
+        return sa, y
+
+    def value(self, states):
+        """
+        Estimated value of the policy in the given states, i.e., the
+        Q-function in the states and the actions of the policy.
+        Args:
+            states (numpy.array): the states to be evaluated.
+                                  Dimensions: (nsamples x state_dim)
+        Returns:
+            the values. Dimensions: (nsamples,)
+        """
+        if self._iteration == 0:
+            raise ValueError(
+                'The model must be trained before being evaluated')
+        states = self._check_states(states)
+
+        return self._predict(states, self._policy_actions(states))
+
+    def evaluate(self, initial_states):
+        """
+        Estimate the discounted return of the policy from the given initial
+        states, as evaluate_policy with the 'discounted' metric.
+        Args:
+            initial_states (numpy.array): the initial states.
+                                          Dimensions: (nsamples x state_dim)
+        Returns:
+            metric (float): the mean of the values of the initial states
+            confidence (float): 95% confidence level of the mean over the
+                                initial states (it does not account for the
+                                error of the estimated Q-function)
+        """
+        values = self.value(initial_states)
+
+        return values.mean(), 2 * values.std() / np.sqrt(values.shape[0])
+
+    def reset(self):
+        """
+        Reset.
+        """
+        super(FQE, self).reset()
+        self._next_actions = None
+
+    def _policy_actions(self, states):
+        """
+        Actions of the policy in the given states, one row per state.
+        """
+        actions = self.policy.draw_action(states, np.zeros(states.shape[0]),
+                                          True)
+
+        return np.asarray(actions, dtype=float).reshape(states.shape[0],
+                                                        self.action_dim)
+
+    def _predict(self, states, actions):
+        """
+        Q-function in the given states and actions.
+        """
+        if self._features is not None:
+            samples = self._features.combine(
+                self._features.state_features(states), actions)
+        else:
+            samples = np.concatenate((states, actions), axis=1)
+
+        return self._estimator.predict(samples)
@@ -0,0 +1,3 @@
+from .FQE import FQE
+
+__all__ = ['FQE']
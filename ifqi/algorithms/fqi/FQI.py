@@ -6,6 +6,7 @@ from numpy.matlib import repmat
 from ifqi.algorithms.algorithm import Algorithm
 from ifqi.preprocessors.features import select_features
 from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.compiledforest import compile_forest
 
 """
 This class implements the functions to run Fitted Q-Iteration algorithm.
@@ -28,7 +29,9 @@ class FQI(Algorithm):
         provide None inputs after the first iteration.
 
         Args:
-            sast (numpy.array, None): the input in the dataset
+            sast (numpy.array, TransitionDataset, None): the input in the
+                dataset, or a TransitionDataset providing both the input and
+                the output
             r (numpy.array, None): the output in the dataset
             **kwargs: additional parameters to be provided to the fit function
             of the estimator
@@ -36,11 +39,20 @@ class FQI(Algorithm):
         Returns:
             sa, y: the preprocessed input and output
         """
-        if sast is not None:
+        if hasattr(sast, 'fqi_inputs'):
+            self._sa, self._snext, self._absorbing, rewards = \
+                sast.fqi_inputs()
+            if r is None:
+                r = rewards
+            if self._features is not None:
+                self._sa = self._features(self._sa)
+        elif sast is not None:
             next_states_idx = self.state_dim + self.action_dim
             self._sa = sast[:, :next_states_idx]
             self._snext = sast[:, next_states_idx:-1]
             self._absorbing = sast[:, -1]
+            if self._features is not None:
+                self._sa = self._features(self._sa)
         if r is not None:
             self._r = r
 
@@ -63,18 +75,22 @@ class FQI(Algorithm):
             y = self._r + self.gamma * maxq
 
         self._estimator.fit(self._sa, y.ravel(), **kwargs)
+        if self._compiled:
+            self._predictor = compile_forest(self._estimator)
 
         self._iteration += 1
+        self._new_version()
 
         return self._sa, y
 
-    def fit(self, sast, r, **kwargs):
+    def fit(self, sast, r=None, **kwargs):
         """
         Perform steps of FQI using input data sast and r.
 
         Args:
-            sast (numpy.array): the input in the dataset
-            r (numpy.array): the output in the dataset
+            sast (numpy.array, TransitionDataset): the input in the dataset,
+                or a TransitionDataset providing both the input and the output
+            r (numpy.array, None): the output in the dataset
             **kwargs: additional parameters to be provided to the fit function
                       of the estimator
 
@@ -1,13 +1,13 @@
 from __future__ import print_function
 
+import multiprocessing
 import numpy as np
 import warnings
-from builtins import super
-from pybrain.optimization import ExactNES
+from builtins import range, super
 
 from ifqi.algorithms.algorithm import Algorithm
-from keras.models import Sequential
-from keras.layers import Dense
+from ifqi.algorithms.pbo.operator import Adam, OperatorMLP, \
+    forward_population
 
 """
 # pybrain is giving a lot of deprecation warnings
@@ -15,22 +15,77 @@ warnings.filterwarnings('ignore', module='pybrain')
 
 """
 
+# minibatch of the fit scored by each worker process: estimator, samples and
+# targets
+_worker = dict()
+
 
 class PBO(Algorithm):
     def __init__(self, estimator, state_dim, action_dim,
                  discrete_actions, gamma, horizon,
-                 features=None, verbose=False):
-        self._regressor_rho = Sequential()
-        self._regressor_rho.add(Dense(30, input_shape=(2,), activation='relu'))
-        self._regressor_rho.add(Dense(2, activation='linear'))
-        self._regressor_rho.compile(optimizer='rmsprop', loss='mse')
+                 features=None, verbose=False, optimizer='nes',
+                 learning_rate=0.01, n_steps=50, batch_size=None,
+                 n_jobs=1, seed=None):
+        """
+        Constructor.
+        Args:
+            optimizer (str, 'nes'): 'nes' optimizes the weights of a Keras
+                                    operator with ExactNES, 'adam' trains a
+                                    NumPy operator with minibatch Adam on the
+                                    analytic gradient of the Bellman loss
+            learning_rate (float, 0.01): Adam learning rate
+            n_steps (int, 50): Adam steps for each fit, each one computing
+                               the gradient on one minibatch
+            batch_size (int, None): transitions in each minibatch, all of
+                                    them if None. With 'adam' a minibatch is
+                                    drawn at each step, with 'nes' once per
+                                    fit and shared by all the candidates of
+                                    all the generations
+            n_jobs (int, 1): number of processes evaluating the candidates
+                             of each NES generation, all the cores if -1.
+                             The processes are started at each fit and
+                             receive its minibatch once
+            seed (int, None): seed of the NumPy operator initialization and
+                              of the minibatches
+            The other arguments are described in Algorithm.
+        """
+        theta_dim = np.size(estimator._regressor.theta)
+        self._optimizer_type = optimizer
+        if optimizer == 'nes':
+            # Keras and pybrain are only needed by the NES backend
+            from keras.models import Sequential
+            from keras.layers import Dense
+
+            self._regressor_rho = Sequential()
+            self._regressor_rho.add(Dense(30, input_shape=(theta_dim,),
+                                          activation='relu'))
+            self._regressor_rho.add(Dense(theta_dim, activation='linear'))
+            self._regressor_rho.compile(optimizer='rmsprop', loss='mse')
+        elif optimizer == 'adam':
+            self._operator = OperatorMLP(theta_dim, hidden_neurons=(30,),
+                                         random_state=seed)
+            self._adam = Adam(learning_rate)
+        else:
+            raise ValueError('unknown optimizer.')
+        self._n_steps = n_steps
+        self._batch_size = batch_size
+        if n_jobs < 0:
+            n_jobs = max(1, multiprocessing.cpu_count() + 1 + n_jobs)
+        self._n_jobs = n_jobs
+        self._pool = None
+        self._rng = np.random.RandomState(seed)
 
         super(PBO, self).__init__(estimator, state_dim, action_dim,
                                   discrete_actions, gamma, horizon,
                                   features, verbose)
 
     def fit(self, sast=None, r=None):
-        if sast is not None:
+        if hasattr(sast, 'fqi_inputs'):
+            self._sa, self._snext, self._absorbing, rewards = \
+                sast.fqi_inputs()
+            if r is None:
+                r = rewards
+        elif sast is not None:
             next_states_idx = self.state_dim + self.action_dim
             self._sa = sast[:, :next_states_idx]
             self._snext = sast[:, next_states_idx:-1]
@@ -40,22 +95,136 @@ class PBO(Algorithm):
 
         old_theta = self._estimator._regressor.theta
 
-        self._optimizer = ExactNES(self._fitness, self._get_rho(),
-                                   minimize=True, batchSize=100)
+        # the max Q-values depend on the current theta only, so the target
+        # is the same for all the candidates evaluated during this fit
+        maxQ, _ = self.maxQA(self._snext, self._absorbing)
+        self._target = self._r + self.gamma * maxQ
+
+        if self._optimizer_type == 'adam':
+            self._estimator._regressor.theta = self._fit_gradient()
+        else:
+            # one minibatch for the whole fit: importance mixing reuses the
+            # fitness of earlier samples and the best candidate is picked
+            # across generations, so all of them must be scored on the same
+            # transitions
+            self._fitness_idxs = self._minibatch()
+            from ifqi.algorithms.pbo.nes import PopulationNES
 
-        rho, score = self._optimizer.learn()
-        self._estimator._regressor.theta = self._f(rho)
+            self._optimizer = PopulationNES(self._population_fitness,
+                                            self._get_rho(), minimize=True,
+                                            batchSize=100)
+
+            if self._n_jobs > 1:
+                idxs = self._fitness_idxs
+                self._pool = multiprocessing.Pool(
+                    self._n_jobs, initializer=_init_worker,
+                    initargs=(self._estimator, self._sa[idxs],
+                              self._target[idxs]))
+            try:
+                rho, score = self._optimizer.learn()
+            finally:
+                if self._pool is not None:
+                    self._pool.terminate()
+                    self._pool.join()
+                    self._pool = None
+            self._estimator._regressor.theta = self._f(rho)
 
         self._iteration += 1
+        self._new_version()
 
         return (self._estimator._regressor.theta,
                 np.sum(self._estimator._regressor.theta - old_theta) ** 2)
 
+    def _fit_gradient(self):
+        """
+        Train the NumPy operator with minibatch Adam on the Bellman loss of
+        the theta it produces from the current one. The operator weights and
+        the optimizer state carry over to the next fit.
+        Returns:
+            the new theta
+        Raises:
+            ValueError: if the new theta is not finite
+        """
+        theta = np.asarray(self._estimator._regressor.theta, dtype=float)
+        for _ in range(self._n_steps):
+            idxs = self._minibatch()
+            sa = self._sa[idxs]
+            new_theta = self._operator.forward(theta)
+            residual = self._estimator.predict(sa, f_rho=new_theta) - \
+                self._target[idxs]
+            # chain rule: loss -> Q-values -> new theta -> operator weights
+            grad_theta = 2. * residual.dot(
+                self._q_gradient(sa, new_theta)) / residual.shape[0]
+            self._adam.step(self._operator.params,
+                            self._operator.backward(grad_theta))
+
+        new_theta = self._operator.forward(theta)
+        if not np.all(np.isfinite(new_theta)):
+            raise ValueError('the operator diverged, try a lower '
+                             'learning_rate.')
+
+        return new_theta
+
+    def _minibatch(self):
+        """
+        Returns:
+            the indexes of a random minibatch of transitions (drawn with
+            replacement), or all the transitions if batch_size is None
+        """
+        n_samples = self._sa.shape[0]
+        if self._batch_size is None or self._batch_size >= n_samples:
+            return slice(None)
+
+        return self._rng.randint(n_samples, size=self._batch_size)
+
+    def _q_gradient(self, sa, theta):
+        """
+        Gradient of the Q-values with respect to theta, computed by the
+        gradient(sa, f_rho=theta) method of the Q-function if available,
+        with central finite differences otherwise.
+        Returns:
+            the gradients. Dimensions: (n_samples x theta_dim)
+        """
+        q = self._estimator._regressor
+        if hasattr(q, 'gradient'):
+            return q.gradient(sa, f_rho=theta)
+
+        grad = np.empty((sa.shape[0], theta.size))
+        for j in range(theta.size):
+            h = 1e-6 * max(1., abs(theta[j]))
+            e = np.zeros(theta.size)
+            e[j] = h
+            grad[:, j] = (self._estimator.predict(sa, f_rho=theta + e) -
+                          self._estimator.predict(sa, f_rho=theta - e)) / \
+                (2 * h)
+
+        return grad
+
     def _fitness(self, rho):
-        Q = self._estimator.predict(self._sa, f_rho=self._f(rho))
-        maxQ, _ = self.maxQA(self._snext, self._absorbing)
+        return self._population_fitness(np.array([rho]))[0]
+
+    def _population_fitness(self, rhos):
+        """
+        Compute the Bellman residual of the thetas produced by the operator
+        with each of the given weights.
+        Args:
+            rhos (np.array): operator weights. Dimensions: (n_candidates x
+                             n_weights)
+        Returns:
+            the fitness of each candidate
+        """
+        thetas = self._f_population(rhos)
+        if self._pool is None:
+            idxs = self._fitness_idxs
+            return _bellman_residuals(self._estimator, self._sa[idxs],
+                                      self._target[idxs], thetas)
 
-        return np.mean((Q - self._r - self.gamma * maxQ) ** 2)
+        # the processes hold the minibatch, the tasks only carry the thetas
+        n_chunks = min(self._n_jobs, thetas.shape[0])
+        out = self._pool.map(_worker_residuals,
+                             np.array_split(thetas, n_chunks))
+
+        return np.concatenate(out)
 
     def _f(self, rho):
         self._set_rho(rho)
@@ -65,6 +234,23 @@ class PBO(Algorithm):
 
         return output
 
+    def _f_population(self, rhos):
+        """
+        Apply the operator with each of the given weights to the current
+        theta, as a batched NumPy forward pass of the operator network.
+        Args:
+            rhos (np.array): operator weights. Dimensions: (n_candidates x
+                             n_weights)
+        Returns:
+            the new thetas. Dimensions: (n_candidates x theta_dim)
+        """
+        shapes = [w.shape for w in self._regressor_rho.get_weights()]
+        activations = [l.get_config()['activation']
+                       for l in self._regressor_rho.layers]
+
+        return forward_population(rhos, self._estimator._regressor.theta,
+                                  shapes, activations)
+
     def _get_rho(self):
         rho = self._regressor_rho.get_weights()
         r = list()
@@ -85,3 +271,41 @@ class PBO(Algorithm):
             del rho[:b.size]
 
         self._regressor_rho.set_weights(weights)
+
+
+def _init_worker(estimator, sa, target):
+    _worker['minibatch'] = (estimator, sa, target)
+
+
+def _worker_residuals(thetas):
+    estimator, sa, target = _worker['minibatch']
+
+    return _bellman_residuals(estimator, sa, target, thetas)
+
+
+def _bellman_residuals(estimator, sa, target, thetas):
+    """
+    Mean squared difference between the Q-values of the samples for each
+    theta and the target.
+    """
+    fitness = np.empty(thetas.shape[0])
+    # bound the size of the (candidates x samples) Q-values
+    step = max(1, (1 << 22) // sa.shape[0])
+    for i in range(0, thetas.shape[0], step):
+        Q = _population_Q(estimator, sa, thetas[i:i + step])
+        fitness[i:i + step] = np.mean((Q - target) ** 2, axis=1)
+
+    return fitness
+
+
+def _population_Q(estimator, sa, thetas):
+    """
+    Q-values of the samples for each theta. The estimator computes them in
+    one call, through the f_rhos parameter, if it supports it (enabled by
+    has_population_predict()), otherwise once per theta.
+    """
+    if hasattr(estimator, 'has_population_predict') and \
+            estimator.has_population_predict():
+        return np.asarray(estimator.predict(sa, f_rhos=thetas))
+
+    return np.array([estimator.predict(sa, f_rho=theta) for theta in thetas])
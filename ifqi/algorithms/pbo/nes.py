@@ -0,0 +1,68 @@
+from builtins import super
+
+import numpy as np
+from pybrain.optimization import ExactNES
+from pybrain.utilities import DivergenceError
+
+
+class PopulationNES(ExactNES):
+    """
+    ExactNES evaluating each batch of samples with a single call to a
+    population fitness function (n_samples x n_parameters -> n_samples),
+    instead of one call per sample. The samples are drawn exactly as in
+    ExactNES (including importance mixing), their fitness is filled in once
+    the batch is complete. In online mode each sample is evaluated as soon
+    as it is drawn, as in ExactNES.
+    """
+
+    def __init__(self, population_evaluator, initEvaluable=None, **kwargs):
+        self._population_evaluator = population_evaluator
+        super(PopulationNES, self).__init__(
+            lambda x: population_evaluator(np.array([x]))[0], initEvaluable,
+            **kwargs)
+
+    def _produceNewSample(self, z=None, p=None):
+        if self.online:
+            # _onlineLearn uses the fitness of each sample right away
+            return super(PopulationNES, self)._produceNewSample(z, p)
+        if z is None:
+            p = np.random.randn(self.numParameters)
+            z = np.dot(self.factorSigma.T, p) + self.x
+        if p is None:
+            p = np.dot(np.linalg.inv(self.factorSigma).T, (z - self.x))
+        self.allPs.append(p)
+        self.allSamples.append(z)
+        # evaluated with the rest of the batch in _produceSamples
+        self._pending.append(len(self.allFitnesses))
+        self.allFitnesses.append(None)
+
+        return z, None
+
+    def _produceSamples(self):
+        self._pending = []
+        super(PopulationNES, self)._produceSamples()
+        if len(self._pending) == 0:
+            return
+
+        samples = np.array([self.allSamples[i] for i in self._pending])
+        fitnesses = np.asarray(self._population_evaluator(samples),
+                               dtype=float)
+        # ExactNES maximizes: the fitness is negated when minimizing
+        if self._wasOpposed:
+            fitnesses = -fitnesses
+        if not np.all(np.isfinite(fitnesses)):
+            raise DivergenceError
+
+        # same bookkeeping as BlackBoxOptimizer._oneEvaluation
+        for i, fit, z in zip(self._pending, fitnesses, samples):
+            self.allFitnesses[i] = fit
+            if (self.numEvaluations == 0 or self.bestEvaluation is None or
+                    (self.minimize and fit <= self.bestEvaluation) or
+                    (not self.minimize and fit >= self.bestEvaluation)):
+                self.bestEvaluation = fit
+                self.bestEvaluable = z.copy()
+            self.numEvaluations += 1
+            if self.storeAllEvaluated:
+                self._allEvaluated.append(z.copy())
+            if self.storeAllEvaluations:
+                self._allEvaluations.append(-fit if self._wasOpposed else fit)
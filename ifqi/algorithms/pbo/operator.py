@@ -0,0 +1,185 @@
+from builtins import range
+
+import numpy as np
+
+"""
+NumPy operator network for PBO and its optimizer.
+"""
+
+ACTIVATIONS = {'linear': lambda x: x,
+               'relu': lambda x: np.maximum(x, 0.),
+               'tanh': np.tanh,
+               'sigmoid': lambda x: 1. / (1. + np.exp(-x))}
+
+# derivatives of the activations as functions of their outputs
+_DERIVATIVES = {'linear': lambda y: np.ones_like(y),
+                'relu': lambda y: (y > 0).astype(y.dtype),
+                'tanh': lambda y: 1. - y ** 2,
+                'sigmoid': lambda y: y * (1. - y)}
+
+
+class OperatorMLP(object):
+    """
+    Multilayer perceptron mapping Q-function parameters (theta) to new
+    Q-function parameters. All the weights live in one contiguous flat
+    buffer (params), the weight matrices and bias vectors of the layers are
+    views on it, so that the optimizer updates them in place.
+    """
+
+    def __init__(self, n_input, hidden_neurons=(30,), activation='relu',
+                 output_activation='linear', random_state=None):
+        """
+        Constructor.
+        Args:
+            n_input (int): dimensionality of theta (input and output)
+            hidden_neurons (list, (30,)): number of neurons of each hidden
+                                          layer
+            activation (str, 'relu'): activation of the hidden layers
+            output_activation (str, 'linear'): activation of the output layer
+            random_state (int, None): seed of the initial weights
+        """
+        sizes = [n_input] + list(hidden_neurons) + [n_input]
+        self.shapes = [(sizes[i], sizes[i + 1]) for i in range(len(sizes) - 1)]
+        self.activations = [activation] * len(hidden_neurons) + \
+            [output_activation]
+        self.n_params = sum(i * o + o for i, o in self.shapes)
+
+        self.params = np.zeros(self.n_params)
+        self.weights, self.biases = [], []
+        offset = 0
+        for i, o in self.shapes:
+            self.weights.append(
+                self.params[offset:offset + i * o].reshape(i, o))
+            offset += i * o
+            self.biases.append(self.params[offset:offset + o])
+            offset += o
+
+        # Glorot uniform initialization, as the Keras Dense default
+        rng = np.random.RandomState(random_state)
+        for w in self.weights:
+            limit = np.sqrt(6. / np.sum(w.shape))
+            w[:] = rng.uniform(-limit, limit, w.shape)
+
+    def get_params(self):
+        return self.params.copy()
+
+    def set_params(self, params):
+        self.params[:] = params
+
+    def forward(self, theta):
+        """
+        Args:
+            theta (np.array): Q-function parameters. Dimensions: (n x
+                              n_input) or (n_input,)
+        Returns:
+            the output of the operator, with the same shape as theta
+        """
+        h = np.atleast_2d(theta)
+        self._outputs = [h]
+        for w, b, a in zip(self.weights, self.biases, self.activations):
+            h = ACTIVATIONS[a](h.dot(w) + b)
+            self._outputs.append(h)
+
+        return h.reshape(np.shape(theta))
+
+    def backward(self, grad_output):
+        """
+        Backpropagate the gradient of a loss with respect to the output of
+        the last forward call.
+        Args:
+            grad_output (np.array): gradient of the loss with respect to the
+                                    output of the operator
+        Returns:
+            the gradient of the loss with respect to params (flat)
+        """
+        grad = np.empty(self.n_params)
+        offsets = np.cumsum([0] + [i * o + o for i, o in self.shapes])
+        delta = np.atleast_2d(grad_output)
+        for l in reversed(range(len(self.shapes))):
+            i, o = self.shapes[l]
+            delta = delta * _DERIVATIVES[self.activations[l]](
+                self._outputs[l + 1])
+            grad[offsets[l]:offsets[l] + i * o] = \
+                self._outputs[l].T.dot(delta).ravel()
+            grad[offsets[l] + i * o:offsets[l + 1]] = delta.sum(axis=0)
+            delta = delta.dot(self.weights[l].T)
+
+        return grad
+
+    def forward_population(self, params, theta):
+        """
+        Apply the operator with each of the given weights to theta.
+        Args:
+            params (np.array): flat weights. Dimensions: (n_candidates x
+                               n_params)
+            theta (np.array): Q-function parameters. Dimensions: (n_input,)
+        Returns:
+            the outputs. Dimensions: (n_candidates x n_input)
+        """
+        shapes = [s for i, o in self.shapes for s in ((i, o), (o,))]
+        return forward_population(params, theta, shapes, self.activations)
+
+
+class Adam(object):
+    """
+    Adam optimizer updating a flat parameter buffer in place.
+    """
+
+    def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999,
+                 epsilon=1e-8):
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.t = 0
+        self._m = None
+        self._v = None
+
+    def step(self, params, grad):
+        """
+        Args:
+            params (np.array): the parameters, updated in place
+            grad (np.array): the gradient of the loss at params
+        """
+        if self._m is None:
+            self._m = np.zeros_like(params)
+            self._v = np.zeros_like(params)
+        self.t += 1
+        self._m *= self.beta1
+        self._m += (1 - self.beta1) * grad
+        self._v *= self.beta2
+        self._v += (1 - self.beta2) * grad ** 2
+        m = self._m / (1 - self.beta1 ** self.t)
+        v = self._v / (1 - self.beta2 ** self.t)
+        params -= self.learning_rate * m / (np.sqrt(v) + self.epsilon)
+
+
+def forward_population(params, theta, shapes, activations):
+    """
+    Batched forward pass of a dense network for many weight vectors.
+    Args:
+        params (np.array): flat weights, each row laid out as the
+                           concatenation of the raveled weight matrix and
+                           bias vector of each layer. Dimensions:
+                           (n_candidates x n_params)
+        theta (np.array): the input of the network
+        shapes (list): shapes of the weight matrices and bias vectors, in
+                       order
+        activations (list): name of the activation of each layer
+    Returns:
+        the outputs. Dimensions: (n_candidates x n_output)
+    """
+    n_candidates = params.shape[0]
+    h = np.tile(np.asarray(theta, dtype=float).ravel(), (n_candidates, 1))
+    offset = 0
+    for l, a in enumerate(activations):
+        w, b = shapes[2 * l], shapes[2 * l + 1]
+        W = params[:, offset:offset + np.prod(w)].reshape(
+            (n_candidates,) + tuple(w))
+        offset += np.prod(w)
+        h = np.einsum('pi,pio->po', h, W) + \
+            params[:, offset:offset + np.prod(b)]
+        offset += np.prod(b)
+        h = ACTIVATIONS[a](h)
+
+    return h
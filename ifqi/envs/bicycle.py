@@ -134,15 +134,22 @@ class Bicycle(Environment):
         nactions = 9
         self.action_space = spaces.Discrete(nactions)
 
+        # unit vector towards the goal
+        self._goal_dir = self._unit_vector(self._goal_loc)
+
+        # batch of bicycles (see reset_batch)
+        self._batch_state = None
+        self._batch_position = None
+
         # initialize state
-        self._seed()
-        self._reset()
+        self.seed()
+        self.reset()
 
-    def _seed(self, seed=None):
+    def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
 
-    def _reset(self, state=None):
+    def reset(self, state=None):
         self._absorbing = False
 
         psi = 0.
@@ -161,9 +168,9 @@ class Bicycle(Environment):
             4] = psi  # numpy.arctan((self.position[1]-self.position[0])/(self.position[2] - self.position[3]))
         return self._getState()
 
-    def _step(self, action, render=False):
-        intAction = int(action)
-        T = 2. * ((intAction / 3) - 1)  # Torque on handle bars
+    def step(self, action, render=False):
+        intAction = int(numpy.ravel(action)[0])
+        T = 2. * ((intAction // 3) - 1)  # Torque on handle bars
         d = 0.02 * ((intAction % 3) - 1)  # Displacement of center of mass (in meters)
         # if self.noise > 0:
         #    d += (numpy.random.random()-0.5)*self.noise # Noise between [-0.02, 0.02] meters
@@ -272,6 +279,192 @@ class Bicycle(Environment):
             reward = ret
         return self._getState(), reward, self._absorbing, {}
 
+    def reset_batch(self, n_envs, states=None, seeds=None):
+        """
+        Reset a batch of n_envs bicycles, stepped together by step_running.
+        The batch is kept by the environment, apart from the bicycle of step
+        and reset, as the observations do not contain the positions of the
+        tires. As reset, the bicycles start upright at the origin, heading
+        north.
+        Args:
+            n_envs (int): number of bicycles
+            states (np.array, None): ignored, as in reset
+            seeds (np.array, None): ignored, the dynamics are deterministic
+        Returns:
+            the observations of the bicycles. Dimensions: (n_envs x 5)
+        """
+        psi = 0.
+        self._batch_state = numpy.zeros((n_envs, 5))
+        self._batch_position = numpy.zeros((n_envs, 5))
+        self._batch_position[:, 2] = self._l * numpy.cos(psi)
+        self._batch_position[:, 3] = self._l * numpy.sin(psi)
+        self._batch_position[:, 4] = psi
+
+        return self._observe_batch(self._batch_state, self._batch_position)
+
+    def step_running(self, states, actions):
+        """
+        Step the bicycles of the batch (see reset_batch) that are still
+        running, with the same dynamics and rewards as step, all at once.
+        Unlike step_batch of the other environments, the next states are
+        not a function of the given ones, which lack the positions of the
+        tires, but of the state of the batch. The bicycles reaching an
+        absorbing state are removed from the batch, so that the rows of the
+        next call are the remaining bicycles in the same order, as in
+        lockstep evaluation.
+        Args:
+            states (np.array): the observations of the running bicycles,
+                               only used to check the size of the batch.
+                               Dimensions: (n x 5)
+            actions (np.array): the actions. Dimensions: (n,) or (n x 1)
+        Returns:
+            next_states (np.array): the observations. Dimensions: (n x 5)
+            rewards (np.array): the rewards. Dimensions: (n,)
+            absorbing (np.array): the absorbing flags. Dimensions: (n,)
+        """
+        assert self._batch_state is not None and \
+            len(states) == self._batch_state.shape[0], \
+            'the states do not match the batch, see reset_batch'
+        state, position, rewards, absorbing = self._step_batch(
+            self._batch_state, self._batch_position, actions)
+        observations = self._observe_batch(state, position)
+        self._batch_state = state[~absorbing]
+        self._batch_position = position[~absorbing]
+
+        return observations, rewards, absorbing
+
+    def _step_batch(self, state, position, actions):
+        """
+        Vectorized dynamics of step.
+        Args:
+            state (np.array): omega, omega_dot, omega_ddot, theta, theta_dot
+                              of each bicycle. Dimensions: (n x 5)
+            position (np.array): x_f, y_f, x_b, y_b, psi of each bicycle.
+                                 Dimensions: (n x 5)
+            actions (np.array): the actions. Dimensions: (n,) or (n x 1)
+        Returns:
+            the next state and position, the rewards and the absorbing flags
+        """
+        actions = numpy.asarray(actions).ravel().astype(int)
+        T = 2. * ((actions // 3) - 1)
+        d = 0.02 * ((actions % 3) - 1)
+
+        omega, omega_dot, omega_ddot, theta, theta_dot = state.T
+        x_f, y_f, x_b, y_b, psi = position.T
+
+        goal_angle_old = self._goal_angle_batch(x_f - x_b, y_f - y_b)
+
+        df = (self._delta_time / float(self._sim_steps))
+        for step in range(self._sim_steps):
+            # infinite radius when the handlebar is straight
+            straight = theta == 0
+            safe_theta = numpy.where(straight, 1., theta)
+            r_f = numpy.where(straight, 1.e8,
+                              self._l / numpy.abs(numpy.sin(safe_theta)))
+            r_b = numpy.where(straight, 1.e8,
+                              self._l / numpy.abs(numpy.tan(safe_theta)))
+            r_CM = numpy.where(straight, 1.e8,
+                               numpy.sqrt((self._l - self._c) ** 2 +
+                                          (self._l ** 2 /
+                                           numpy.tan(safe_theta) ** 2)))
+
+            varphi = omega + numpy.arctan(d / self._h)
+
+            omega_ddot = (self._h * self._M * self._gravity *
+                          numpy.sin(varphi) -
+                          numpy.cos(varphi) *
+                          (self._Inertia_dv * self._sigma_dot * theta_dot +
+                           numpy.sign(theta) * self._v ** 2 *
+                           (self._M_d * self._r * (1. / r_f + 1. / r_b) +
+                            self._M * self._h / r_CM))) / self._Inertia_bc
+
+            theta_ddot = (T - self._Inertia_dv * self._sigma_dot *
+                          omega_dot) / self._Inertia_dl
+
+            omega_dot = omega_dot + df * omega_ddot
+            omega = omega + df * omega_dot
+            theta_dot = theta_dot + df * theta_ddot
+            theta = numpy.clip(theta + df * theta_dot,
+                               self._state_range[3, 0],
+                               self._state_range[3, 1])
+
+            front_term = psi + theta + numpy.sign(psi + theta) * \
+                numpy.arcsin(self._v * df / (2. * r_f))
+            back_term = psi + numpy.sign(psi) * \
+                numpy.arcsin(self._v * df / (2. * r_b))
+            x_f = x_f - numpy.sin(front_term)
+            y_f = y_f + numpy.cos(front_term)
+            x_b = x_b - numpy.sin(back_term)
+            y_b = y_b + numpy.cos(back_term)
+
+            # keep the length of the bicycle constant
+            dist = numpy.sqrt((x_f - x_b) ** 2 + (y_f - y_b) ** 2)
+            fix = numpy.abs(dist - self._l) > 0.01
+            x_b = numpy.where(fix, x_b + (x_b - x_f) * (self._l - dist) / dist,
+                              x_b)
+            y_b = numpy.where(fix, y_b + (y_b - y_f) * (self._l - dist) / dist,
+                              y_b)
+
+            psi = self._psi_batch(x_f, y_f, x_b, y_b)
+
+        state = numpy.column_stack((omega, omega_dot, omega_ddot, theta,
+                                    theta_dot))
+        position = numpy.column_stack((x_f, y_f, x_b, y_b, psi))
+
+        fell = numpy.abs(omega) > self._state_range[0, 1]
+        if self._navigate:
+            at_goal = ~fell & (numpy.sqrt(numpy.maximum(
+                0., (x_f - self._goal_loc[0]) ** 2 +
+                (y_f - self._goal_loc[1]) ** 2 - self._goal_rsqrd)) < 1.e-5)
+            goal_angle = self._goal_angle_batch(x_f - x_b, y_f - y_b)
+            rewards = 0.1 * (self._angle_wrap_pi_batch(goal_angle_old) -
+                             self._angle_wrap_pi_batch(goal_angle))
+            rewards[at_goal] = self._reward_goal
+        else:
+            at_goal = numpy.zeros(fell.shape, dtype=bool)
+            rewards = numpy.full(fell.shape, self._reward_shaping)
+        rewards[fell] = -1.0
+
+        return state, position, rewards, fell | at_goal
+
+    def _observe_batch(self, state, position):
+        goal_angle = self._goal_angle_batch(position[:, 0] - position[:, 2],
+                                            position[:, 1] - position[:, 3])
+
+        return numpy.column_stack((state[:, [0, 1, 3, 4]], goal_angle))
+
+    def _goal_angle_batch(self, dx, dy):
+        """
+        Vectorized angle_between(goal_loc, (dx, dy)) * pi / 180.
+        """
+        norm = numpy.sqrt(dx ** 2 + dy ** 2)
+        cos = self._goal_dir[0] * (dx / norm) + self._goal_dir[1] * (dy / norm)
+
+        return numpy.arccos(numpy.clip(cos, -1.0, 1.0)) * numpy.pi / 180.
+
+    def _psi_batch(self, x_f, y_f, x_b, y_b):
+        """
+        Vectorized heading of step.
+        """
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(
+                (x_f == x_b) & (y_f - y_b < 0), numpy.pi,
+                numpy.where(y_f - y_b > 0,
+                            numpy.arctan((x_b - x_f) / (y_f - y_b)),
+                            numpy.sign(x_b - x_f) * (numpy.pi / 2.) -
+                            numpy.arctan((y_f - y_b) / (x_b - x_f))))
+
+    def _angle_wrap_pi_batch(self, x):
+        """
+        Vectorized _angleWrapPi.
+        """
+        return numpy.where(
+            x > numpy.pi,
+            x - 2.0 * numpy.pi * numpy.ceil((x - numpy.pi) / (2.0 * numpy.pi)),
+            numpy.where(x < -numpy.pi,
+                        x + 2.0 * numpy.pi *
+                        numpy.ceil((-numpy.pi - x) / (2.0 * numpy.pi)), x))
+
     def _unit_vector(self, vector):
         """ Returns the unit vector of the vector.  """
         return vector / numpy.linalg.norm(vector)
@@ -9,4 +9,4 @@ class Environment(gym.Env):
         self.horizon = None
 
     def set_seed(self, seed=None):
-        self._seed(seed=seed)
+        self.seed(seed=seed)
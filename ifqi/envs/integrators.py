@@ -0,0 +1,254 @@
+from builtins import range
+from collections import namedtuple
+
+import numpy as np
+from scipy.integrate import odeint
+
+"""
+Numerical integrators of the dynamics of the continuous-time environments.
+"""
+
+ODE = namedtuple('ODE', ['derivative', 'batch_derivative', 'jacobian',
+                         'n_positions'])
+ODE.__doc__ = """
+Description of the dynamics of an environment, whose state (extended with
+the action, which has null derivative) starts with n_positions positions
+followed by their velocities.
+    derivative (callable): derivative(y, t) of a single state, as in odeint
+    batch_derivative (callable): batch_derivative(x) of a batch of states,
+        one per row
+    jacobian (callable, None): jacobian(y, t) of derivative, as the Dfun of
+        odeint
+    n_positions (int): number of positions
+"""
+
+
+def select_integrator(integrator, rtol=1.49012e-8, atol=1.49012e-8,
+                      mxstep=0):
+    """
+    Build the integrator described by integrator.
+    Args:
+        integrator (str, dict, Integrator): name of the integrator
+            ('lsoda', 'lsoda_jac', 'dopri5', 'rk4' or 'euler'), or a
+            dictionary whose key 'name' selects the integrator and the
+            other keys are its parameters, or an integrator
+        rtol (float, 1.49012e-8): default relative tolerance
+        atol (float, 1.49012e-8): default absolute tolerance
+        mxstep (int, 0): default maximum number of steps of odeint
+    Returns:
+        the integrator
+    """
+    if isinstance(integrator, Integrator):
+        return integrator
+    f = {'name': integrator} if not isinstance(integrator, dict) \
+        else integrator
+    if f['name'] in ('lsoda', 'lsoda_jac'):
+        return LSODA(rtol=f.get('rtol', rtol), atol=f.get('atol', atol),
+                     mxstep=f.get('mxstep', mxstep),
+                     jacobian=f['name'] == 'lsoda_jac')
+    elif f['name'] == 'dopri5':
+        return DOPRI5(rtol=f.get('rtol', rtol), atol=f.get('atol', atol),
+                      mxstep=f.get('mxstep', mxstep))
+    elif f['name'] == 'rk4':
+        return RK4(n_substeps=f.get('n_substeps', 10))
+    elif f['name'] == 'euler':
+        return SemiImplicitEuler(n_substeps=f.get('n_substeps', 10))
+    else:
+        raise ValueError('unknown integrator.')
+
+
+class Integrator(object):
+    """
+    Base class of the integrators. integrate(ode, x, dt) returns the states
+    reached after dt from the states x (one per row). Vectorized
+    integrators work on all the rows at once, the others integrate one row
+    at a time.
+    """
+    vectorized = True
+
+    def integrate(self, ode, x, dt):
+        raise NotImplementedError
+
+
+class LSODA(Integrator):
+    """
+    Adaptive LSODA integration with odeint, optionally with the analytic
+    Jacobian of the dynamics.
+    """
+    vectorized = False
+
+    def __init__(self, rtol=1.49012e-8, atol=1.49012e-8, mxstep=0,
+                 jacobian=False):
+        self.rtol = rtol
+        self.atol = atol
+        self.mxstep = mxstep
+        self.jacobian = jacobian
+
+    def integrate(self, ode, x, dt):
+        Dfun = ode.jacobian if self.jacobian else None
+        return np.array([odeint(ode.derivative, y, [0, dt], Dfun=Dfun,
+                                rtol=self.rtol, atol=self.atol,
+                                mxstep=self.mxstep)[-1]
+                         for y in x]).reshape(x.shape)
+
+
+class DOPRI5(Integrator):
+    """
+    Adaptive Dormand-Prince 5(4) integration of all the rows at once (see
+    dopri5); the last few rows needing many steps are integrated by odeint.
+    mxstep bounds the steps of both, 0 meaning their defaults (10000 steps
+    for dopri5).
+    """
+
+    def __init__(self, rtol=1.49012e-8, atol=1.49012e-8, mxstep=0):
+        self.rtol = rtol
+        self.atol = atol
+        self.mxstep = mxstep
+        self._fallback = LSODA(rtol, atol, mxstep)
+
+    def integrate(self, ode, x, dt):
+        return dopri5(ode.batch_derivative, x, dt, rtol=self.rtol,
+                      atol=self.atol,
+                      max_steps=self.mxstep if self.mxstep > 0 else 10000,
+                      fallback=lambda y: self._fallback.integrate(ode, y, dt))
+
+
+class RK4(Integrator):
+    """
+    Classic fourth order Runge-Kutta integration with n_substeps fixed
+    steps (see rk4).
+    """
+
+    def __init__(self, n_substeps=10):
+        self.n_substeps = n_substeps
+
+    def integrate(self, ode, x, dt):
+        return rk4(ode.batch_derivative, x, dt, self.n_substeps)
+
+
+class SemiImplicitEuler(Integrator):
+    """
+    Semi-implicit (symplectic) Euler integration with n_substeps fixed
+    steps: at each step the velocities are updated with the current
+    accelerations, then the positions with the new velocities.
+    """
+
+    def __init__(self, n_substeps=10):
+        self.n_substeps = n_substeps
+
+    def integrate(self, ode, x, dt):
+        n = ode.n_positions
+        h = dt / float(self.n_substeps)
+        x = np.array(x, dtype=float)
+        for i in range(self.n_substeps):
+            x[:, n:2 * n] += h * ode.batch_derivative(x)[:, n:2 * n]
+            x[:, :n] += h * x[:, n:2 * n]
+
+        return x
+
+
+def rk4(f, x, dt, n_substeps=1):
+    """
+    Integrate dx/dt = f(x) over a time interval with the classic fourth
+    order Runge-Kutta method, in n_substeps equal steps. The state can be a
+    batch of states, one per row, if f works on the whole batch.
+    Args:
+        f (callable): the derivative of the state
+        x (np.array): the initial state(s)
+        dt (float): the length of the time interval
+        n_substeps (int, 1): the number of steps
+    Returns:
+        the state(s) at the end of the interval
+    """
+    h = dt / float(n_substeps)
+    for i in range(n_substeps):
+        k1 = f(x)
+        k2 = f(x + h / 2. * k1)
+        k3 = f(x + h / 2. * k2)
+        k4 = f(x + h * k3)
+        x = x + h / 6. * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    return x
+
+
+# Dormand-Prince 5(4) coefficients
+_DOPRI_C = (0., 1. / 5, 3. / 10, 4. / 5, 8. / 9, 1., 1.)
+_DOPRI_A = ((),
+            (1. / 5,),
+            (3. / 40, 9. / 40),
+            (44. / 45, -56. / 15, 32. / 9),
+            (19372. / 6561, -25360. / 2187, 64448. / 6561, -212. / 729),
+            (9017. / 3168, -355. / 33, 46732. / 5247, 49. / 176,
+             -5103. / 18656),
+            (35. / 384, 0., 500. / 1113, 125. / 192, -2187. / 6784,
+             11. / 84))
+# difference between the 5th and the 4th order weights
+_DOPRI_E = (71. / 57600, 0., -71. / 16695, 71. / 1920, -17253. / 339200,
+            22. / 525, -1. / 40)
+
+
+def dopri5(f, x, dt, rtol=1e-5, atol=1e-5, max_steps=10000, fallback=None,
+           fallback_rows=16, fallback_after=20):
+    """
+    Integrate dx/dt = f(x) over a time interval with the Dormand-Prince
+    5(4) method. Each row of x is a state with its own adaptive step size,
+    controlled so that the local error estimate of each component is below
+    atol + rtol * |x| (as the tolerances of odeint); f is evaluated at once
+    on the rows that have not reached the end of the interval. As each step
+    has a fixed overhead, the few rows where the dynamics are stiff, which
+    need many small steps, can be left to a fallback integrator (e.g.,
+    odeint, that switches to an implicit method).
+    Args:
+        f (callable): the derivative of the states, working on any subset
+                      of rows
+        x (np.array): the initial states. Dimensions: (n x d)
+        dt (float): the length of the time interval
+        rtol (float, 1e-5): relative tolerance
+        atol (float, 1e-5): absolute tolerance
+        max_steps (int, 10000): maximum number of (accepted or rejected)
+                                steps
+        fallback (callable, None): function integrating the initial states
+            of the rows that have not reached the end of the interval; if
+            None an error is raised when max_steps steps are not enough
+        fallback_rows (int, 16): the rows still running are passed to the
+            fallback as soon as they are at most fallback_rows
+        fallback_after (int, 20): minimum number of steps before passing
+            the rows to the fallback
+    Returns:
+        the states at the end of the interval
+    """
+    x0 = np.asarray(x, dtype=float)
+    x = x0.copy()
+    n = x.shape[0]
+    t = np.zeros(n)
+    h = np.full(n, dt)
+    active = np.arange(n)
+    for i in range(max_steps):
+        if active.size == 0 or fallback is not None and \
+                i >= fallback_after and active.size <= fallback_rows:
+            break
+        y = x[active]
+        hh = h[active][:, np.newaxis]
+        k = [f(y)]
+        for a in _DOPRI_A[1:]:
+            k.append(f(y + hh * sum(aj * kj for aj, kj in zip(a, k))))
+        y_new = y + hh * sum(aj * kj for aj, kj in zip(_DOPRI_A[-1], k))
+        error = hh * sum(e * kj for e, kj in zip(_DOPRI_E, k))
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        norm = np.sqrt(np.mean((error / scale) ** 2, axis=1))
+
+        accepted = norm <= 1
+        rows = active[accepted]
+        x[rows] = y_new[accepted]
+        t[rows] += h[rows]
+        factor = np.clip(0.9 * np.maximum(norm, 1e-10) ** -0.2, 0.2, 5.)
+        h[active] = np.minimum(h[active] * np.where(accepted, factor,
+                                                    np.minimum(factor, 1.)),
+                               dt - t[active])
+        active = active[t[active] < dt * (1 - 1e-12)]
+    if active.size > 0:
+        if fallback is None:
+            raise RuntimeError('dopri5: maximum number of steps reached')
+        x[active] = fallback(x0[active])
+
+    return x
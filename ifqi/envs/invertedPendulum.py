@@ -20,9 +20,6 @@ class InvPendulum(Environment):
         self.horizon = 400
         self.gamma = .95
 
-        self._theta = 0.
-        self._theta_dot = 0.
-
         self._g = 9.8
         self._m = 2.
         self._M = 8.
@@ -39,31 +36,118 @@ class InvPendulum(Environment):
         self.observation_space = spaces.Box(low=-high, high=high)
         self.action_space = fqispaces.DiscreteValued([-50, 0, 50], decimals=0)
 
+        # generators and noise of the batch of pendulums (see reset_batch)
+        self._batch_rngs = None
+        self._batch_noise = None
+
         # initialize state
         self.seed()
         self.reset()
 
     def step(self, u):
-        n_u = u + 2 * self._noise * np.random.rand() - self._noise
-
-        a = self._g * np.sin(self._theta) - self._alpha * self._m * self._l * \
-            (self._theta_dot ** 2) * np.sin(2 * self._theta) / 2. \
-            - self._alpha * np.cos(self._theta) * n_u
-        b = 4. * self._l / 3. \
-            - self._alpha * self._m * self._l * (np.cos(self._theta)) ** 2
-
-        theta_ddot = a / b
-
-        self._theta_dot = self._theta_dot + self._dt * theta_ddot
-        self._theta = self._theta + self._dt * self._theta_dot
+        n_u = np.ravel(u)[0] + 2 * self._noise * self.np_random.rand() - \
+            self._noise
+        self._state = self._dynamics(self._state[np.newaxis],
+                                     np.array([n_u]))[0]
 
         reward = 0
-        if np.abs(self._theta) > self._angle_max:
+        if np.abs(self._state[0]) > self._angle_max:
             self._absorbing = True
             reward = -1
 
         return self.get_state(), reward, self._absorbing, {}
 
+    def reset_batch(self, n_envs, states=None, seeds=None):
+        """
+        Reset a batch of n_envs pendulums, stepped together by step_running.
+        Each pendulum has its own random generator for the noise of the
+        actions: if seeds is given, the i-th generator is seeded with
+        seeds[i], as the environment by seed, otherwise its seed is drawn
+        from the generator of the environment, so that the batch is
+        reproducible from the seed of the environment.
+        Args:
+            n_envs (int): number of pendulums
+            states (np.array, None): initial states, as in reset.
+                                     Dimensions: (n_envs x 2)
+            seeds (np.array, None): seeds of the pendulums
+        Returns:
+            the initial states. Dimensions: (n_envs x 2)
+        """
+        if seeds is None:
+            seeds = self.np_random.randint(2 ** 31, size=n_envs)
+        self._batch_rngs = [seeding.np_random(int(seed))[0] for seed in seeds]
+        self._batch_noise = np.zeros((n_envs, 0))
+
+        return np.zeros((n_envs, 2)) if states is None \
+            else np.array(states, dtype=float).reshape(n_envs, 2)
+
+    def step_batch(self, states, actions):
+        """
+        Step a batch of states at once, drawing the noise of the actions from
+        the generator of the environment, one value per state. The
+        environment state is not changed.
+        Args:
+            states (np.array): the states. Dimensions: (n x 2)
+            actions (np.array): the actions. Dimensions: (n,) or (n x 1)
+        Returns:
+            next_states (np.array): the next states. Dimensions: (n x 2)
+            rewards (np.array): the rewards. Dimensions: (n,)
+            absorbing (np.array): the absorbing flags. Dimensions: (n,)
+        """
+        states = np.asarray(states, dtype=float).reshape(-1, 2)
+        n_u = np.asarray(actions, dtype=float).ravel() + \
+            2 * self._noise * self.np_random.rand(states.shape[0]) - \
+            self._noise
+
+        next_states = self._dynamics(states, n_u)
+        absorbing = np.abs(next_states[:, 0]) > self._angle_max
+
+        return next_states, np.where(absorbing, -1., 0.), absorbing
+
+    def step_running(self, states, actions):
+        """
+        Step the pendulums of the batch (see reset_batch) that are still
+        running, all at once. Each pendulum draws its noise from its own
+        generator, so that it follows the same trajectory as the environment
+        seeded with its seed and stepped with the same actions. The
+        pendulums reaching an absorbing state are removed from the batch, so
+        that the rows of the next call are the remaining pendulums in the
+        same order, as in lockstep evaluation.
+        Args:
+            states (np.array): the states of the running pendulums.
+                               Dimensions: (n x 2)
+            actions (np.array): the actions. Dimensions: (n,) or (n x 1)
+        Returns:
+            next_states (np.array): the next states. Dimensions: (n x 2)
+            rewards (np.array): the rewards. Dimensions: (n,)
+            absorbing (np.array): the absorbing flags. Dimensions: (n,)
+        """
+        states = np.asarray(states, dtype=float).reshape(-1, 2)
+        assert self._batch_rngs is not None and \
+            states.shape[0] == len(self._batch_rngs), \
+            'the states do not match the batch, see reset_batch'
+        if self._batch_noise.shape[1] == 0:
+            # the noise of the next steps, drawn in blocks from the same
+            # stream as the one of step
+            self._batch_noise = np.array(
+                [rng.rand(self.horizon) for rng in self._batch_rngs]
+            ).reshape(states.shape[0], -1)
+        n_u = np.asarray(actions, dtype=float).ravel() + \
+            2 * self._noise * self._batch_noise[:, 0] - self._noise
+        self._batch_noise = self._batch_noise[:, 1:]
+
+        next_states = self._dynamics(states, n_u)
+        absorbing = np.abs(next_states[:, 0]) > self._angle_max
+        rewards = np.where(absorbing, -1., 0.)
+
+        # unlike step_batch, the state of the batch follows the episodes
+        if absorbing.any():
+            self._batch_rngs = [rng for rng, a in
+                                zip(self._batch_rngs, absorbing) if not a]
+            self._batch_noise = self._batch_noise[~absorbing]
+
+        return next_states, rewards, absorbing
+
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
@@ -71,11 +155,35 @@ class InvPendulum(Environment):
     def reset(self, state=None):
         self._absorbing = False
         if state is None:
-            self.state = np.array([0., 0.])
+            self._state = np.array([0., 0.])
         else:
-            self.state = state
+            self._state = np.array(state, dtype=float)
 
         return self.get_state()
 
     def get_state(self):
-        return self.state
+        return self._state
+
+    def _dynamics(self, states, n_u):
+        """
+        Args:
+            states (np.array): the states. Dimensions: (n x 2)
+            n_u (np.array): the noisy actions. Dimensions: (n,)
+        Returns:
+            the next states. Dimensions: (n x 2)
+        """
+        theta = states[:, 0]
+        theta_dot = states[:, 1]
+
+        a = self._g * np.sin(theta) - self._alpha * self._m * self._l * \
+            (theta_dot ** 2) * np.sin(2 * theta) / 2. \
+            - self._alpha * np.cos(theta) * n_u
+        b = 4. * self._l / 3. \
+            - self._alpha * self._m * self._l * (np.cos(theta)) ** 2
+
+        theta_ddot = a / b
+
+        theta_dot = theta_dot + self._dt * theta_ddot
+        theta = theta + self._dt * theta_dot
+
+        return np.column_stack((theta, theta_dot))
@@ -4,7 +4,6 @@ from numbers import Number
 # import gym
 from gym import spaces
 from gym.utils import seeding
-from gym.spaces import prng
 import numpy as np
 
 from .environment import Environment
@@ -86,7 +85,7 @@ class LQG1D(Environment):
 
     def reset(self, state=None):
         if state is None:
-            self.state = np.array([prng.np_random.uniform(low=-self.max_pos,
+            self.state = np.array([self.np_random.uniform(low=-self.max_pos,
                                                           high=self.max_pos)])
         else:
             self.state = np.array(state)
@@ -42,33 +42,57 @@ class SwingPendulum(Environment):
         self.seed()
         self.reset()
 
-    def _step(self, action, render=False):
-        u = action[0]
-        theta, theta_dot = tuple(self.get_state())
-
-        theta_ddot = (-self._dt * theta_dot + self._m * self._l * self._g *
-                      np.sin(theta_dot) + u)
-
-        # bound theta_dot
-        theta_dot_temp = theta_dot + theta_ddot
-        if theta_dot_temp > np.pi / self._dt:
-            theta_dot_temp = np.pi / self._dt
-        if theta_dot_temp < -np.pi / self._dt:
-            theta_dot_temp = -np.pi / self._dt
-
-        theta_dot = theta_dot_temp
-        theta += theta_dot * self._dt
-
-        # adjust Theta
-        if theta > np.pi:
-            theta -= 2 * np.pi
-        if theta < -np.pi:
-            theta += 2 * np.pi
-
-        self._state = np.array([theta, theta_dot])
-        reward = np.cos(theta)
-
-        return self.get_state(), reward, False, {}
+    def step(self, action, render=False):
+        self._state, rewards = self._dynamics(self._state[np.newaxis],
+                                              np.ravel(action)[:1])
+        self._state = self._state[0]
+
+        return self.get_state(), rewards[0], False, {}
+
+    def reset_batch(self, n_envs, states=None, seeds=None):
+        """
+        Reset a batch of n_envs pendulums, stepped together by step_batch.
+        The initial angles are drawn as in reset: if seeds is given, the i-th
+        one by a generator seeded with seeds[i], as the environment by seed,
+        otherwise by the generator of the environment.
+        Args:
+            n_envs (int): number of pendulums
+            states (np.array, None): initial states, as in reset.
+                                     Dimensions: (n_envs x 2)
+            seeds (np.array, None): seeds of the pendulums
+        Returns:
+            the initial states. Dimensions: (n_envs x 2)
+        """
+        initial_states = np.zeros((n_envs, 2))
+        for i in range(n_envs):
+            if seeds is not None:
+                rng = seeding.np_random(int(seeds[i]))[0]
+            else:
+                rng = self.np_random
+            if states is None:
+                initial_states[i, 0] = rng.uniform(low=-np.pi, high=np.pi)
+            else:
+                initial_states[i] = np.ravel(states[i])
+
+        return initial_states
+
+    def step_batch(self, states, actions):
+        """
+        Step a batch of states at once. The dynamics are deterministic, so
+        the environment state is not changed.
+        Args:
+            states (np.array): the states. Dimensions: (n x 2)
+            actions (np.array): the actions. Dimensions: (n,) or (n x 1)
+        Returns:
+            next_states (np.array): the next states. Dimensions: (n x 2)
+            rewards (np.array): the rewards. Dimensions: (n,)
+            absorbing (np.array): the absorbing flags. Dimensions: (n,)
+        """
+        next_states, rewards = self._dynamics(
+            np.asarray(states, dtype=float).reshape(-1, 2),
+            np.asarray(actions, dtype=float).ravel())
+
+        return next_states, rewards, np.zeros(rewards.shape, dtype=bool)
 
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
@@ -85,3 +109,28 @@ class SwingPendulum(Environment):
 
     def get_state(self):
         return self._state
+
+    def _dynamics(self, states, u):
+        """
+        Args:
+            states (np.array): the states. Dimensions: (n x 2)
+            u (np.array): the actions. Dimensions: (n,)
+        Returns:
+            the next states (n x 2) and the rewards (n,)
+        """
+        theta = states[:, 0]
+        theta_dot = states[:, 1]
+
+        theta_ddot = (-self._dt * theta_dot + self._m * self._l * self._g *
+                      np.sin(theta_dot) + u)
+
+        # bound theta_dot
+        theta_dot = np.clip(theta_dot + theta_ddot, -np.pi / self._dt,
+                            np.pi / self._dt)
+        theta = theta + theta_dot * self._dt
+
+        # adjust Theta
+        theta = np.where(theta > np.pi, theta - 2 * np.pi, theta)
+        theta = np.where(theta < -np.pi, theta + 2 * np.pi, theta)
+
+        return np.column_stack((theta, theta_dot)), np.cos(theta)
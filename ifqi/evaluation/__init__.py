@@ -1,5 +1,10 @@
 # from evaluation import evaluate_policy, collectEpisode
 #
 # __all__ = ["evaluate_policy", "collectEpisode"]
-from .utils import check_dataset
-__all__ = ['check_dataset']
\ No newline at end of file
+from .buffer import TransitionBuffer
+from .dataset import TransitionDataset
+from .pool import EvaluationPool
+from .profiling import EpisodeProfiler
+from .utils import check_dataset, dataset_errors
+__all__ = ['EpisodeProfiler', 'EvaluationPool', 'TransitionBuffer',
+           'TransitionDataset', 'check_dataset', 'dataset_errors']
\ No newline at end of file
@@ -0,0 +1,115 @@
+import numpy as np
+
+"""
+Growable buffers of transitions.
+"""
+
+
+class TransitionBuffer(object):
+    """
+    Transitions stored column-wise in preallocated arrays (states, actions,
+    rewards, next states, absorbing and end-of-episode flags). When full, the
+    arrays double their capacity, so that appending n transitions costs O(n)
+    amortized. The dimensions of the columns are set by the first
+    transition. If max_size is given, the transitions added once the buffer
+    holds max_size transitions are discarded.
+    """
+
+    def __init__(self, capacity=1024, max_size=None):
+        """
+        Constructor.
+        Args:
+            capacity (int, 1024): initial number of transitions
+            max_size (int, None): maximum number of transitions
+        """
+        self.capacity = capacity if max_size is None \
+            else max(1, min(capacity, max_size))
+        self.max_size = max_size
+        self.size = 0
+        self._columns = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def full(self):
+        return self.max_size is not None and self.size >= self.max_size
+
+    def add(self, state, action, reward, next_state, absorbing, end):
+        """
+        Append a transition.
+        """
+        if self.full:
+            return
+        values = (np.ravel(state), np.ravel(action), np.ravel(reward),
+                  np.ravel(next_state), absorbing, end)
+        if self._columns is None:
+            self._columns = [np.empty((self.capacity, np.size(v)))
+                             for v in values]
+        elif self.size == self.capacity:
+            self._grow(2 * self.capacity)
+        for column, v in zip(self._columns, values):
+            column[self.size] = v
+        self.size += 1
+
+    def add_batch(self, states, actions, rewards, next_states, absorbing,
+                  end):
+        """
+        Append n transitions, given as arrays with one row (or element) per
+        transition (only the first ones, up to max_size).
+        """
+        values = [np.asarray(v, dtype=float).reshape(len(states), -1)
+                  for v in (states, actions, rewards, next_states, absorbing,
+                            end)]
+        n = len(states) if self.max_size is None \
+            else min(len(states), self.max_size - self.size)
+        if n <= 0:
+            return
+        if self._columns is None:
+            self._columns = [np.empty((self.capacity, v.shape[1]))
+                             for v in values]
+        if self.size + n > self.capacity:
+            self._grow(max(2 * self.capacity, self.size + n))
+        for column, v in zip(self._columns, values):
+            column[self.size:self.size + n] = v[:n]
+        self.size += n
+
+    def extend(self, other):
+        """
+        Append all the transitions of another buffer (only the first ones, up
+        to max_size).
+        """
+        if other.size > 0:
+            self.add_batch(*other.columns())
+
+    def columns(self):
+        """
+        Returns:
+            views on the filled part of the columns: states, actions,
+            rewards, next states, absorbing and end flags (each with shape
+            (size x column dimension))
+        """
+        if self._columns is None:
+            return []
+
+        return [c[:self.size] for c in self._columns]
+
+    def to_array(self):
+        """
+        Returns:
+            the transitions as a dataset matrix whose rows are
+            [state, action, reward, next state, absorbing, end]
+        """
+        if self._columns is None:
+            return np.zeros((0, 0))
+
+        return np.concatenate(self.columns(), axis=1)
+
+    def _grow(self, capacity):
+        if self.max_size is not None:
+            capacity = min(capacity, self.max_size)
+        for i, c in enumerate(self._columns):
+            new = np.empty((capacity, c.shape[1]))
+            new[:self.size] = c[:self.size]
+            self._columns[i] = new
+        self.capacity = capacity
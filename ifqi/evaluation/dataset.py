@@ -0,0 +1,167 @@
+import numpy as np
+
+"""
+Columnar dataset of transitions.
+"""
+
+
+class TransitionDataset(object):
+    """
+    Transitions stored as separate contiguous arrays: the state-action
+    matrix (whose first state_dim columns are the states and the others the
+    actions), the next states, the rewards and the absorbing and
+    end-of-episode flags. The offsets of the episodes are computed once.
+    Datasets made of the first episodes are views on the same arrays, and
+    the inputs of FQI are returned without copies.
+    """
+
+    def __init__(self, sa, next_states, rewards, absorbing, end, state_dim):
+        """
+        Constructor.
+        Args:
+            sa (np.array): states and actions. Dimensions: (n_samples x
+                           state_dim + action_dim)
+            next_states (np.array): next states. Dimensions: (n_samples x
+                                    state_dim)
+            rewards (np.array): rewards. Dimensions: (n_samples,)
+            absorbing (np.array): absorbing flags. Dimensions: (n_samples,)
+            end (np.array): end-of-episode flags. Dimensions: (n_samples,)
+            state_dim (int): state dimensionality
+        """
+        self.sa = sa
+        self.next_states = next_states
+        self.rewards = rewards
+        self.absorbing = absorbing
+        self.end = end
+        self.state_dim = state_dim
+        self.action_dim = sa.shape[1] - state_dim
+
+        # episode i spans the rows episode_starts[i]:episode_ends[i]; a last
+        # unfinished episode is counted as an episode
+        ends = np.flatnonzero(end == 1) + 1
+        if ends.shape[0] == 0 or ends[-1] != sa.shape[0]:
+            ends = np.append(ends, sa.shape[0]) if sa.shape[0] > 0 else ends
+        self.episode_ends = ends
+        self.episode_starts = np.concatenate(([0], ends[:-1])).astype(int)
+
+    @classmethod
+    def from_array(cls, dataset, state_dim, action_dim, reward_dim=1):
+        """
+        Build the dataset from a dataset matrix, as returned by
+        collect_episodes, copying each field once into its own array.
+        Args:
+            dataset (np.array): the dataset [s, a, r, s', absorbing, end]
+            state_dim (int): state dimensionality
+            action_dim (int): action dimensionality
+            reward_dim (int, 1): reward dimensionality
+        Returns:
+            the dataset
+        """
+        reward_idx = state_dim + action_dim
+        nextstate_idx = reward_idx + reward_dim
+        dataset = np.asarray(dataset)
+
+        return cls(np.ascontiguousarray(dataset[:, :reward_idx]),
+                   np.ascontiguousarray(
+                       dataset[:, nextstate_idx:nextstate_idx + state_dim]),
+                   np.ascontiguousarray(dataset[:, reward_idx]),
+                   np.ascontiguousarray(dataset[:, -2]),
+                   np.ascontiguousarray(dataset[:, -1]),
+                   state_dim)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Build the dataset from a TransitionBuffer.
+        """
+        states, actions, rewards, next_states, absorbing, end = \
+            buffer.columns()
+
+        return cls(np.concatenate((states, actions), axis=1),
+                   next_states.copy(), rewards[:, 0].copy(),
+                   absorbing[:, 0].copy(), end[:, 0].copy(),
+                   states.shape[1])
+
+    def __len__(self):
+        return self.sa.shape[0]
+
+    @property
+    def n_episodes(self):
+        return self.episode_ends.shape[0]
+
+    @property
+    def states(self):
+        return self.sa[:, :self.state_dim]
+
+    @property
+    def actions(self):
+        return self.sa[:, self.state_dim:]
+
+    def first_episodes(self, k):
+        """
+        Args:
+            k (int): number of episodes
+        Returns:
+            the dataset of the first k episodes, as views on this one
+        """
+        n = self.episode_ends[k - 1] if k > 0 else 0
+
+        return self._rows(slice(0, n))
+
+    def episode(self, i):
+        """
+        Returns:
+            the dataset of the i-th episode, as views on this one
+        """
+        return self._rows(slice(self.episode_starts[i], self.episode_ends[i]))
+
+    def bootstrap(self, random_state=None, by_episode=False):
+        """
+        Resample the dataset with replacement. The result is a copy.
+        Args:
+            random_state (int, RandomState, None): random generator or seed
+            by_episode (bool, False): whether to resample whole episodes
+                                      instead of transitions
+        Returns:
+            the resampled dataset
+        """
+        rng = random_state if isinstance(random_state,
+                                         np.random.RandomState) \
+            else np.random.RandomState(random_state)
+        if by_episode:
+            episodes = rng.randint(self.n_episodes, size=self.n_episodes)
+            lengths = self.episode_ends - self.episode_starts
+            idxs = np.repeat(self.episode_starts[episodes] -
+                             np.cumsum(lengths[episodes]) +
+                             lengths[episodes], lengths[episodes]) + \
+                np.arange(lengths[episodes].sum())
+        else:
+            idxs = rng.randint(len(self), size=len(self))
+            # the resampled transitions are not consecutive anymore
+            return TransitionDataset(self.sa[idxs], self.next_states[idxs],
+                                     self.rewards[idxs],
+                                     self.absorbing[idxs],
+                                     np.ones(len(self)), self.state_dim)
+
+        return self._rows(idxs)
+
+    def fqi_inputs(self):
+        """
+        Returns:
+            sa, next_states, absorbing, rewards: the inputs of FQI, without
+            copies
+        """
+        return self.sa, self.next_states, self.absorbing, self.rewards
+
+    def to_array(self):
+        """
+        Returns:
+            the dataset matrix [s, a, r, s', absorbing, end]
+        """
+        return np.column_stack((self.sa, self.rewards, self.next_states,
+                                self.absorbing, self.end))
+
+    def _rows(self, rows):
+        return TransitionDataset(self.sa[rows], self.next_states[rows],
+                                 self.rewards[rows], self.absorbing[rows],
+                                 self.end[rows], self.state_dim)
@@ -1,15 +1,19 @@
 from __future__ import print_function
 from builtins import range
 import time
+from contextlib import contextmanager
+from copy import deepcopy
 
-import gym
 import numpy as np
+from gym.spaces import prng
 from ..envs.utils import get_space_info
-from joblib import Parallel, delayed
+from .buffer import TransitionBuffer
+from .shards import ShardWriter, load_shards
+from joblib import Parallel, delayed, effective_n_jobs
 
 
 def _eval_and_render(mdp, policy, metric='discounted',
-                     initial_states=None, render=True):
+                     initial_states=None, n_episodes=1, render=True):
     """
     This function evaluate a policy on the specified metric by executing
     multiple episode and visualize its performance
@@ -20,6 +24,8 @@ def _eval_and_render(mdp, policy, metric='discounted',
             'average']
         initial_states (np.array, None): initial states to use to evaluate
             policy
+        n_episodes (int): number of episodes to be simulated. It is used
+            only when initial_states is None
         render (bool, True): whether to render the step of the environment
     Return:
         metric (float): the selected evaluation metric
@@ -27,16 +33,18 @@ def _eval_and_render(mdp, policy, metric='discounted',
         step (float): average number of step before finish
         step_confidence (float):  95% confidence level for step average
     """
-    n_episodes = initial_states.shape[0]
     values, steps = _eval_and_render_vectorial(mdp, policy, metric,
-                                               initial_states, render)
+                                               initial_states, n_episodes,
+                                               render)
+    n_episodes = values.shape[0]
 
     return values.mean(), 2 * values.std() / np.sqrt(n_episodes), \
            steps.mean(), 2 * steps.std() / np.sqrt(n_episodes)
 
 
 def _eval_and_render_vectorial(mdp, policy, metric='discounted',
-                               initial_states=None, n_episodes=1, render=True):
+                               initial_states=None, n_episodes=1, render=True,
+                               seeds=None, buffer=None, profiler=None):
     """
     This function evaluate a policy on the specified metric by executing
     multiple episode and visualize its performance
@@ -50,6 +58,13 @@ def _eval_and_render_vectorial(mdp, policy, metric='discounted',
         n_episodes (int): number of episodes to be simulated. It is used
             only when initial_states is None
         render (bool, True): whether to render the step of the environment
+        seeds (np.array, None): seed of each episode; if given, the
+            environment and the global generators are seeded (see _seed_env
+            and _seed_global) before each episode
+        buffer (TransitionBuffer, None): if given, the transitions of the
+            episodes are appended to it, as in collect_episodes
+        profiler (EpisodeProfiler, None): if given, the time spent in the
+            environment and in the policy is measured
     Return:
         metric (float): the selected evaluation metric
         step (float): average number of step before finish
@@ -68,19 +83,30 @@ def _eval_and_render_vectorial(mdp, policy, metric='discounted',
         H = np.inf
     if metric == 'average':
         gamma = 1
+    if profiler is not None:
+        mdp, policy = profiler.wrap(mdp, policy)
     for e in range(n_episodes):
         ep_performance = 0.0
         df = 1
         t = 0
 
         done = False
+        if profiler is not None:
+            profiler.start_episode()
         if render:
             mdp.render(mode='human')
+        if seeds is not None:
+            _seed_env(mdp, int(seeds[e]))
+            _seed_global(int(seeds[e]))
         state = mdp.reset(initial_states[e, :]
                           if initial_states is not None else None)
         while t < H and not done:
             action = policy.draw_action(state, done, True)
-            state, r, done, _ = mdp.step(action)
+            next_state, r, done, _ = mdp.step(action)
+            if buffer is not None:
+                buffer.add(state, action, r, next_state, done,
+                           done or t == H - 1)
+            state = next_state
             ep_performance += df * r
             df *= gamma
             t += 1
@@ -92,39 +118,350 @@ def _eval_and_render_vectorial(mdp, policy, metric='discounted',
             ep_performance /= t
         values[e] = ep_performance
         steps[e] = t
+        if profiler is not None:
+            profiler.end_episode(t)
 
     return values, steps
 
 
-def _parallel_eval(mdp, policy, metric, initial_states, n_episodes,
-                   n_jobs, n_episodes_per_job):
+def _eval_lockstep(mdp, policy, metric='discounted', initial_states=None,
+                   n_episodes=1, seeds=None, buffer=None):
+    """
+    This function evaluate a policy on the specified metric by executing
+    multiple episodes in lockstep: at each time step the policy is queried
+    once on the states of all the running episodes. If the environment
+    provides step_batch(states, actions), returning the next states, the
+    rewards and the done flags, all the episodes are stepped with one call,
+    otherwise each episode runs on its own copy of the environment. An
+    environment providing reset_batch(n_episodes, initial_states, seeds)
+    starts the episodes with it. An environment whose observations do not
+    determine its state, or that draws noise from a generator of each
+    episode, keeps the state of the batch started by reset_batch and steps
+    the episodes still running with step_running(states, actions) instead
+    of step_batch (see Bicycle).
+    Params:
+        mdp (object): the environment to solve
+        policy (object): a policy object (method draw_action accepting a
+            matrix of states is expected)
+        metric (string, 'discounted'): the evaluation metric ['discounted',
+            'average']
+        initial_states (np.array, None): initial states to use to evaluate
+            policy. If None the state is choosen by the mdp
+        n_episodes (int): number of episodes to be simulated. It is used
+            only when initial_states is None
+        seeds (np.array, None): seed of each episode; if given, each episode
+            runs on its own copy of the environment seeded as in the
+            sequential evaluation, unless the environment provides
+            reset_batch, which seeds the episodes of the batch. Either way
+            the global generators are then seeded with the first seed, as
+            the policy is queried on all the episodes at once
+        buffer (TransitionBuffer, None): if given, the transitions of the
+            episodes are appended to it, one episode after the other
+    Return:
+        values (np.array): the metric of each episode
+        steps (np.array): the number of steps of each episode
+    """
     if initial_states is not None:
         n_episodes = initial_states.shape[0] \
             if len(initial_states.shape) > 1 else 1
+        initial_states = initial_states.reshape(n_episodes, -1)
+    stateful = hasattr(mdp, 'step_running')
+    batched = stateful or hasattr(mdp, 'step_batch') and \
+        (seeds is None or hasattr(mdp, 'reset_batch'))
 
-    if hasattr(mdp, 'spec') and mdp.spec is not None:
-        how_many = int(round(n_episodes / n_episodes_per_job))
-        out = Parallel(
-            n_jobs=n_jobs, verbose=2,
-        )(
-            delayed(_eval_and_render)(gym.make(mdp.spec.id), policy,
-                                      n_episodes_per_job, metric,
-                                      initial_states)
-            for _ in range(how_many))
-
-        # out is a list of quadruplet: mean J, 95% conf lev J, mean steps,
-        # 95% conf lev steps
-        # (confidence level should be 0 or NaN)
-        values, steps = np.array(out)
+    # the initial states are drawn from mdp as in the sequential evaluation,
+    # the copies get distinct seeds for their transitions
+    envs = list()
+    states = list()
+    if batched and hasattr(mdp, 'reset_batch'):
+        states = mdp.reset_batch(n_episodes, initial_states, seeds)
+    else:
+        for e in range(n_episodes):
+            if seeds is not None:
+                _seed_env(mdp, int(seeds[e]))
+            states.append(mdp.reset(initial_states[e]
+                                    if initial_states is not None else None))
+            if not batched:
+                env = deepcopy(mdp)
+                if hasattr(mdp, 'np_random') and seeds is None:
+                    _seed_env(env, int(mdp.np_random.randint(2 ** 31)))
+                envs.append(env)
+    states = np.array(states, dtype=float)
+    if seeds is not None:
+        _seed_global(int(seeds[0]))
+
+    gamma = mdp.gamma
+    if hasattr(mdp, 'horizon'):
+        H = mdp.horizon
+    else:
+        H = np.inf
+    if metric == 'average':
+        gamma = 1
+    values = np.zeros(n_episodes)
+    steps = np.zeros(n_episodes)
+    alive = np.arange(n_episodes)
+    df = 1
+    t = 0
+    # transitions of each step, with the index of their episode
+    record = list()
+    while t < H and alive.size > 0:
+        actions = np.asarray(policy.draw_action(
+            states[alive], np.zeros(alive.size), True))
+        if stateful:
+            next_states, rewards, dones = mdp.step_running(states[alive],
+                                                           actions)
+        elif batched:
+            next_states, rewards, dones = mdp.step_batch(states[alive],
+                                                         actions)
+        else:
+            actions = actions.reshape(alive.size, -1)
+            out = [envs[e].step(actions[i]) for i, e in enumerate(alive)]
+            next_states = np.array([o[0] for o in out])
+            rewards = np.array([o[1] for o in out])
+            dones = np.array([o[2] for o in out])
+        dones = np.asarray(dones, dtype=bool).ravel()
+        if buffer is not None:
+            record.append((alive, states[alive],
+                           np.reshape(actions, (alive.size, -1)),
+                           np.ravel(rewards), np.array(next_states), dones,
+                           dones | (t == H - 1)))
+        states[alive] = next_states
+        values[alive] += df * np.ravel(rewards)
+        steps[alive] += 1
+        df *= gamma
+        t += 1
+        alive = alive[~dones]
+
+    if buffer is not None and len(record) > 0:
+        columns = [np.concatenate(c) for c in zip(*record)]
+        order = np.argsort(columns[0], kind='stable')
+        buffer.add_batch(*[c[order] for c in columns[1:]])
+
+    if gamma == 1:
+        values /= steps
+
+    return values, steps
+
+
+def _seed_env(mdp, seed):
+    """
+    Seed the random generator of the environment (gym environments define
+    either seed or _seed).
+    """
+    if hasattr(mdp, '_seed'):
+        mdp._seed(seed)
+    else:
+        mdp.seed(seed)
+
+
+def _seed_global(seed):
+    """
+    Seed the global NumPy generator, used by some environments and
+    policies, and the one gym spaces sample from (action_space.sample),
+    which every process would otherwise start from the same state. Only
+    worker processes seed them freely, as they belong to the caller in the
+    current process.
+    """
+    np.random.seed(seed)
+    prng.seed(seed)
+
+
+@contextmanager
+def _global_rng_preserved(active=True):
+    """
+    If active, restore the state of the global generators (see
+    _seed_global) on exit, so that a seeded evaluation in the current
+    process leaves the random state of the caller as it was.
+    """
+    if not active:
+        yield
+        return
+    state = np.random.get_state()
+    spaces_state = prng.np_random.get_state()
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+        prng.np_random.set_state(spaces_state)
+
+
+def _eval_job(mdp, env_factory, policy, metric, initial_states, n_episodes,
+              seed, episode_seeds=None, record=False, max_size=None):
+    """
+    Evaluate the policy on a chunk of episodes in a worker process, on an
+    environment built by env_factory or on the (pickled) copy of mdp. If
+    record is True, the transitions are recorded into a new buffer of at
+    most max_size transitions, which is returned with the values and steps
+    (None otherwise).
+    """
+    buffer = TransitionBuffer(max_size=max_size) if record else None
+    if env_factory is not None:
+        mdp = env_factory()
+    _seed_env(mdp, seed)
+    _seed_global(seed)
+    values, steps = _eval_and_render_vectorial(mdp, policy, metric,
+                                               initial_states, n_episodes,
+                                               False, episode_seeds, buffer)
+
+    return values, steps, buffer
+
+
+def _parallel_eval_vectorial(mdp, policy, metric, initial_states, n_episodes,
+                             n_jobs, n_episodes_per_job, env_factory=None,
+                             episode_seeds=None, buffer=None):
+    """
+    Evaluate the policy splitting the episodes in chunks of
+    n_episodes_per_job episodes (or initial states) run by a pool of n_jobs
+    processes. Each chunk runs on its own environment, built by env_factory
+    or copied from mdp, with a distinct seed drawn from the random generator
+    of mdp. The per-episode values and steps are merged in the order of the
+    episodes. With a single job or a single chunk the evaluation runs in
+    the current process on mdp. If the seeds of the episodes are given, the
+    episodes do not depend on the chunks. If buffer is given, each chunk
+    records its transitions and the buffers of the chunks are appended to
+    it in order.
+    Return:
+        values (np.array): the metric of each episode
+        steps (np.array): the number of steps of each episode
+    """
+    if initial_states is not None:
+        n_episodes = initial_states.shape[0] \
+            if len(initial_states.shape) > 1 else 1
+    n_chunks = int(np.ceil(n_episodes / float(n_episodes_per_job)))
+
+    if effective_n_jobs(n_jobs) > 1 and n_chunks > 1:
+        rng = mdp.np_random if hasattr(mdp, 'np_random') else np.random
+        seeds = rng.randint(2 ** 31, size=n_chunks)
+        if initial_states is not None:
+            chunks = np.array_split(initial_states.reshape(n_episodes, -1),
+                                    n_chunks)
+            sizes = [c.shape[0] for c in chunks]
+        else:
+            chunks = [None] * n_chunks
+            sizes = [len(c) for c in np.array_split(np.arange(n_episodes),
+                                                    n_chunks)]
+        episode_seeds = np.array_split(episode_seeds, n_chunks) \
+            if episode_seeds is not None else [None] * n_chunks
+        # each chunk records into its own buffer, which can hold no more
+        # than the room left in buffer
+        room = None if buffer is None or buffer.max_size is None \
+            else buffer.max_size - len(buffer)
+        out = Parallel(n_jobs=n_jobs)(
+            delayed(_eval_job)(mdp, env_factory, policy, metric, chunk, size,
+                               int(seed), chunk_seeds, buffer is not None,
+                               room)
+            for chunk, size, seed, chunk_seeds in zip(chunks, sizes, seeds,
+                                                      episode_seeds))
+
+        # out is a list of (values, steps, buffer) triples, one for each
+        # chunk
+        values = np.concatenate([o[0] for o in out])
+        steps = np.concatenate([o[1] for o in out])
+        if buffer is not None:
+            for o in out:
+                buffer.extend(o[2])
     else:
         values, steps = _eval_and_render_vectorial(mdp, policy, metric,
-                                                   initial_states, n_episodes, False)
-    return values.mean(), 2 * values.std() / np.sqrt(n_episodes), \
-           steps.mean(), 2 * steps.std() / np.sqrt(n_episodes)
+                                                   initial_states, n_episodes,
+                                                   False, episode_seeds,
+                                                   buffer)
+    return values, steps
+
+
+def _adaptive_eval(evaluate, initial_states, target_confidence,
+                   relative_error, min_episodes, max_episodes, batch_size,
+                   seeds=None):
+    """
+    Run episodes in batches until the 95% confidence interval of the metric
+    is tight enough: its half-width is at most target_confidence or at most
+    relative_error times the absolute value of the mean. The check is done
+    after each batch, once min_episodes episodes have been run, and no more
+    than max_episodes episodes are run (or no more than the number of
+    initial states, which are used in order).
+    Params:
+        evaluate (callable): function running a batch of episodes,
+            evaluate(initial_states, n_episodes, seeds) -> (values, steps)
+        initial_states (np.array, None): initial states of the episodes
+        target_confidence (float, None): target half-width of the interval
+        relative_error (float, None): target half-width of the interval
+            relative to the absolute value of the mean
+        min_episodes (int): minimum number of episodes
+        max_episodes (int): maximum number of episodes
+        batch_size (int): number of episodes of each batch
+        seeds (np.array, None): seeds of the episodes, used in order
+    Return:
+        values (np.array): the metric of each episode
+        steps (np.array): the number of steps of each episode
+    """
+    if initial_states is not None:
+        initial_states = initial_states.reshape(
+            initial_states.shape[0] if len(initial_states.shape) > 1 else 1,
+            -1)
+        max_episodes = min(max_episodes, initial_states.shape[0])
+    values, steps = np.zeros(0), np.zeros(0)
+    while values.shape[0] < max_episodes:
+        n = min(batch_size, max_episodes - values.shape[0])
+        batch = slice(values.shape[0], values.shape[0] + n)
+        v, s = evaluate(None if initial_states is None
+                        else initial_states[batch], n,
+                        None if seeds is None else seeds[batch])
+        values = np.concatenate((values, v))
+        steps = np.concatenate((steps, s))
+
+        n_episodes = values.shape[0]
+        if n_episodes >= min_episodes:
+            confidence = 2 * values.std() / np.sqrt(n_episodes)
+            if target_confidence is not None and \
+                    confidence <= target_confidence:
+                break
+            if relative_error is not None and \
+                    confidence <= relative_error * np.abs(values.mean()):
+                break
+
+    return values, steps
+
+
+def _episode_seeds(seed, n_episodes):
+    """
+    Returns:
+        the seeds of n_episodes episodes derived from seed: the i-th one
+        does not depend on n_episodes
+    """
+    return np.random.RandomState(seed).randint(2 ** 31, size=n_episodes)
+
+
+def _evaluate_episodes(mdp, policy, metric, initial_states, n_episodes,
+                       n_jobs, n_episodes_per_job, lockstep, env_factory,
+                       seeds, buffer=None, profiler=None):
+    """
+    Run the episodes in lockstep or split among processes, or one after the
+    other in the current process if they are profiled. If the episodes are
+    seeded, the global generators are restored afterwards.
+    Return:
+        values (np.array): the metric of each episode
+        steps (np.array): the number of steps of each episode
+    """
+    with _global_rng_preserved(seeds is not None):
+        if profiler is not None:
+            return _eval_and_render_vectorial(mdp, policy, metric,
+                                              initial_states, n_episodes,
+                                              False, seeds, buffer, profiler)
+        if lockstep:
+            return _eval_lockstep(mdp, policy, metric, initial_states,
+                                  n_episodes, seeds, buffer)
+
+        return _parallel_eval_vectorial(mdp, policy, metric, initial_states,
+                                        n_episodes, n_jobs,
+                                        n_episodes_per_job, env_factory,
+                                        seeds, buffer)
 
 
 def evaluate_policy(mdp, policy, metric='discounted', initial_states=None,
-                    n_episodes=1, render=False, n_jobs=-1, n_episodes_per_job=10):
+                    n_episodes=1, render=False, n_jobs=-1,
+                    n_episodes_per_job=10, lockstep=False, env_factory=None,
+                    target_confidence=None, relative_error=None,
+                    min_episodes=10, max_episodes=1000, batch_size=10,
+                    seed=None, record=None, profiler=None):
     """
     This function evaluate a policy on the given environment w.r.t.
     the specified metric by executing multiple episode.
@@ -136,37 +473,234 @@ def evaluate_policy(mdp, policy, metric='discounted', initial_states=None,
         initial_states (np.array, None): initial states to use to evaluate
             policy. If none the state is selected by the mdp
         render (bool, True): whether to render the step of the environment
+        n_jobs (int, -1): number of processes running the episodes
+        n_episodes_per_job (int, 10): number of episodes of each task sent
+            to the processes; in the adaptive evaluation, each batch is
+            split in at most n_jobs tasks of at most n_episodes_per_job
+            episodes
+        lockstep (bool, False): whether to run all the episodes together,
+            querying the policy once per step on all the running episodes
+            (see _eval_lockstep)
+        env_factory (callable, None): function building the environment of
+            each task; if None each task gets a copy of mdp
+        target_confidence (float, None): if given, the episodes are run in
+            batches until the 95% confidence level of the metric is at most
+            target_confidence (see _adaptive_eval); n_episodes is ignored
+            and the initial states, if given, are used in order
+        relative_error (float, None): if given, the episodes are run in
+            batches until the 95% confidence level of the metric is at most
+            relative_error times the absolute value of the metric
+        min_episodes (int, 10): minimum number of episodes of the adaptive
+            evaluation
+        max_episodes (int, 1000): maximum number of episodes of the adaptive
+            evaluation
+        batch_size (int, 10): number of episodes run between two checks of
+            the adaptive evaluation
+        seed (int, None): if given, the environment is seeded before each
+            episode with a seed derived from this one, so that evaluations
+            with the same seed draw the same initial states and noise in
+            each episode (common random numbers, see compare_policies)
+        record (TransitionBuffer, None): if given, the transitions of the
+            episodes are appended to it, one episode after the other, with
+            the layout of collect_episodes (e.g., to extend the dataset of
+            FQI with record.to_array()); the recording stops when the
+            buffer reaches its max_size
+        profiler (EpisodeProfiler, None): if given, the episodes run one
+            after the other in the current process (n_jobs and lockstep are
+            ignored) and the time spent in the environment, in the policy
+            and in the rest of the loop is added to the profiler
     Return:
         metric (float): the selected evaluation metric
         confidence (float): 95% confidence level for the provided metric
+        step (float): average number of step before finish
+        step_confidence (float):  95% confidence level for step average
     """
     assert metric in ['discounted', 'average'], "unsupported metric"
     if render:
         return _eval_and_render(mdp, policy, metric,
                                 initial_states, n_episodes, True)
+
+    adaptive = target_confidence is not None or relative_error is not None
+    if initial_states is not None:
+        n_episodes = initial_states.shape[0] \
+            if len(initial_states.shape) > 1 else 1
+    if seed is None:
+        seeds = None
+    elif adaptive and initial_states is None:
+        seeds = _episode_seeds(seed, max_episodes)
+    else:
+        seeds = _episode_seeds(seed, n_episodes)
+    if adaptive:
+        def evaluate(states, n, batch_seeds):
+            # split each batch among the processes, since a batch is usually
+            # no larger than n_episodes_per_job
+            per_job = min(n_episodes_per_job,
+                          int(np.ceil(n / float(effective_n_jobs(n_jobs)))))
+            return _evaluate_episodes(mdp, policy, metric, states, n, n_jobs,
+                                      max(per_job, 1), lockstep,
+                                      env_factory, batch_seeds, record,
+                                      profiler)
+        values, steps = _adaptive_eval(evaluate, initial_states,
+                                       target_confidence, relative_error,
+                                       min_episodes, max_episodes, batch_size,
+                                       seeds)
     else:
-        return _parallel_eval(mdp, policy, metric, initial_states,
-                              n_episodes, n_jobs, n_episodes_per_job)
+        values, steps = _evaluate_episodes(mdp, policy, metric,
+                                           initial_states, n_episodes, n_jobs,
+                                           n_episodes_per_job, lockstep,
+                                           env_factory, seeds, record,
+                                           profiler)
+    n_episodes = values.shape[0]
+
+    return values.mean(), 2 * values.std() / np.sqrt(n_episodes), \
+           steps.mean(), 2 * steps.std() / np.sqrt(n_episodes)
+
+
+def compare_policies(mdp, policies, metric='discounted', initial_states=None,
+                     n_episodes=1, seed=None, n_jobs=-1, n_episodes_per_job=10,
+                     lockstep=False, env_factory=None):
+    """
+    This function evaluates several policies with common random numbers:
+    the i-th episode of every policy runs with the same seed, i.e., it
+    starts from the same initial state and draws the same noise from the
+    environment. The difference between the metrics of two policies is then
+    estimated on the paired episodes, whose values are correlated, and its
+    confidence interval is usually much narrower than the one of the
+    difference of two independent evaluations.
+    Params:
+        mdp (object): the environment to solve
+        policies (list): the policy objects to compare
+        metric (string, 'discounted'): the evaluation metric ['discounted',
+            'average']
+        initial_states (np.array, None): initial states to use to evaluate
+            the policies. If none the state is selected by the mdp
+        n_episodes (int, 1): number of episodes of each policy. It is used
+            only when initial_states is None
+        seed (int, None): seed of the episodes; if None it is drawn from the
+            random generator of mdp
+        n_jobs, n_episodes_per_job, lockstep, env_factory: see
+            evaluate_policy
+    Return:
+        metrics (np.array): the metric of each policy
+        confidences (np.array): 95% confidence level of each metric
+        differences (np.array): matrix whose (i, j) element is the mean
+            of the differences between the metrics of policy i and policy j
+            in the paired episodes
+        difference_confidences (np.array): 95% confidence level of each
+            difference
+    """
+    assert metric in ['discounted', 'average'], "unsupported metric"
+    if seed is None:
+        rng = mdp.np_random if hasattr(mdp, 'np_random') else np.random
+        seed = int(rng.randint(2 ** 31))
+    if initial_states is not None:
+        n_episodes = initial_states.shape[0] \
+            if len(initial_states.shape) > 1 else 1
+    seeds = _episode_seeds(seed, n_episodes)
+
+    values = np.array([_evaluate_episodes(mdp, policy, metric,
+                                          initial_states, n_episodes, n_jobs,
+                                          n_episodes_per_job, lockstep,
+                                          env_factory, seeds)[0]
+                       for policy in policies])
+    # differences[i, j, e] is the difference between policy i and policy j
+    # in episode e
+    differences = values[:, np.newaxis, :] - values[np.newaxis, :, :]
+
+    return values.mean(axis=1), \
+        2 * values.std(axis=1) / np.sqrt(n_episodes), \
+        differences.mean(axis=2), \
+        2 * differences.std(axis=2) / np.sqrt(n_episodes)
+
 
+def collect_episodes(mdp, policy=None, n_episodes=1, n_jobs=1,
+                     env_factory=None, profiler=None):
+    """
+    This function can be used to collect a dataset running multiple
+    episodes (see collect_episode). The transitions are written into
+    growable column buffers, so that the cost is linear in the number of
+    episodes.
+
+    Params:
+        mdp (object): the environment to solve
+        policy (object, None): an object that can be evaluated in order to get
+            an action
+        n_episodes (int, 1): number of episodes
+        n_jobs (int, 1): number of processes collecting the episodes. With
+            more than one process the episodes are split in one contiguous
+            chunk per process, each run on its own environment (built by
+            env_factory or copied from mdp) with a distinct seed drawn from
+            the random generator of mdp, and merged in chunk order
+        env_factory (callable, None): function building the environment of
+            each process
+        profiler (EpisodeProfiler, None): if given, the episodes are
+            collected in the current process and the time spent in the
+            environment, in the policy and in the rest of the loop is added
+            to the profiler
 
-def collect_episodes(mdp, policy=None, n_episodes=1, n_jobs=1):
+    Returns:
+        - the dataset of the episodes, one after the other
     """
-    if hasattr(mdp, 'spec') and mdp.spec is not None:
-        out = Parallel(n_jobs=n_jobs, verbose=2,)(
-            delayed(collect_episode)(gym.make(mdp.spec.id), policy)
-            for i in range(n_episodes))
+    n_chunks = min(effective_n_jobs(n_jobs), n_episodes)
+    if n_chunks > 1 and profiler is None:
+        rng = mdp.np_random if hasattr(mdp, 'np_random') else np.random
+        seeds = rng.randint(2 ** 31, size=n_chunks)
+        sizes = [len(c) for c in np.array_split(np.arange(n_episodes),
+                                                n_chunks)]
+        out = Parallel(n_jobs=n_jobs)(
+            delayed(_collect_job)(mdp, env_factory, policy, size, int(seed))
+            for size, seed in zip(sizes, seeds))
 
-        # out is a list of np.array, each one representing an episode
-        # merge the results
-        data = np.concatenate(out, axis=0)
+        # out is a list of buffers, one for each chunk
+        buffer = TransitionBuffer(sum(len(b) for b in out))
+        for b in out:
+            buffer.extend(b)
     else:
-        raise ValueError('collect_episodes must be implemented')
+        buffer = TransitionBuffer()
+        for i in range(n_episodes):
+            _collect_into(mdp, policy, buffer, profiler)
+
+    return buffer.to_array()
+
+
+def stream_episodes(mdp, path, policy=None, n_episodes=1, shard_size=100000):
+    """
+    This function can be used to collect a dataset too large to be kept in
+    memory: the transitions are written to disk while collecting, as .npy
+    shards of shard_size rows with the layout of collect_episodes, plus a
+    manifest of the shards and of the episode boundaries (see ShardWriter).
+
+    Params:
+        mdp (object): the environment to solve
+        path (str): directory of the shards
+        policy (object, None): an object that can be evaluated in order to get
+            an action
+        n_episodes (int, 1): number of episodes
+        shard_size (int, 100000): number of rows of each shard
+
+    Returns:
+        - a memory-mapped view of the dataset (see ShardedArray)
+    """
+    with ShardWriter(path, shard_size) as writer:
+        for i in range(n_episodes):
+            _collect_into(mdp, policy, writer)
+
+    return load_shards(path)
+
+
+def _collect_job(mdp, env_factory, policy, n_episodes, seed):
     """
-    data = np.array(collect_episode(mdp, policy))
-    for i in range(1, n_episodes):
-        data = np.append(data, collect_episode(mdp, policy), axis=0)
+    Collect a chunk of episodes in a worker process.
+    """
+    if env_factory is not None:
+        mdp = env_factory()
+    _seed_env(mdp, seed)
+    _seed_global(seed)
+    buffer = TransitionBuffer()
+    for i in range(n_episodes):
+        _collect_into(mdp, policy, buffer)
 
-    return data
+    return buffer
 
 
 def collect_episode(mdp, policy=None):
@@ -189,12 +723,25 @@ def collect_episode(mdp, policy=None):
             - a flag indicating whether the episode is finished (absorbing state
               is reached or the time horizon is met)
     """
+    buffer = TransitionBuffer(mdp.horizon
+                              if np.isfinite(mdp.horizon) else 1024)
+    _collect_into(mdp, policy, buffer)
+
+    return buffer.to_array()
+
+
+def _collect_into(mdp, policy, buffer, profiler=None):
+    """
+    Run an episode appending its transitions to buffer (a TransitionBuffer
+    or a ShardWriter), optionally profiled by an EpisodeProfiler.
+    """
+    if profiler is not None:
+        mdp, policy = profiler.wrap(mdp, policy)
+        profiler.start_episode()
     done = False
     t = 0
-    data = list()
     horizon = mdp.horizon
     state = mdp.reset()
-    # state_dim, action_dim, reward_dim = get_space_info(mdp)
 
     while t < horizon and not done:
         if policy is not None:
@@ -203,18 +750,9 @@ def collect_episode(mdp, policy=None):
             action = mdp.action_space.sample()
         action = np.array([action]).ravel()
         next_state, reward, done, _ = mdp.step(action)
-        new_el = state.tolist() + action.tolist() + [reward] + \
-                 next_state.tolist()
-        if not done:
-            if t < horizon - 1:
-                new_el += [0, 0]
-            else:
-                new_el += [0, 1]
-        else:
-            new_el += [1, 1]
-
-        data.append(new_el)
+        buffer.add(state, action, reward, next_state, done,
+                   done or t == horizon - 1)
         state = next_state
         t += 1
-
-    return np.array(data)
+    if profiler is not None:
+        profiler.end_episode(t)
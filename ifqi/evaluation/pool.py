@@ -0,0 +1,182 @@
+from __future__ import print_function
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+from copy import copy
+
+import numpy as np
+
+from .evaluation import _eval_and_render_vectorial, _episode_seeds, \
+    _seed_env, _seed_global
+
+"""
+Long-lived pool of processes evaluating policies.
+"""
+
+# attributes of the algorithms holding the training data, not needed to
+# draw actions
+_TRAINING_ATTRIBUTES = ('_sa', '_snext', '_r', '_absorbing', '_target',
+                        '_next_actions')
+
+# state of each worker process: its environment and the last policy loaded
+_worker = dict()
+
+
+class EvaluationPool(object):
+    """
+    Pool of processes evaluating policies on an environment. The environment
+    is sent to each process once, when the pool is created. Each new policy
+    (or new version of a policy, i.e., after each fit, compile_estimator or
+    reset of an algorithm) is written once to a temporary file, without its
+    training data, and loaded once by each process; the evaluation tasks
+    only carry the initial states (or the number of episodes) and a seed.
+    """
+
+    def __init__(self, mdp, n_jobs=-1, n_episodes_per_job=10,
+                 env_factory=None):
+        """
+        Constructor.
+        Args:
+            mdp (object): the environment
+            n_jobs (int, -1): number of processes, all the cores if -1
+            n_episodes_per_job (int, 10): number of episodes of each task
+            env_factory (callable, None): function building the environment
+                of each process; if None each process gets a copy of mdp
+        """
+        self.mdp = mdp
+        self.n_episodes_per_job = n_episodes_per_job
+        if n_jobs < 0:
+            n_jobs = max(1, multiprocessing.cpu_count() + 1 + n_jobs)
+        self.n_jobs = n_jobs
+        self._dir = tempfile.mkdtemp(prefix='ifqi-eval-')
+        self._n_snapshots = 0
+        self._snapshot = None
+        self._version = None
+        self._pool = multiprocessing.Pool(n_jobs, initializer=_init_worker,
+                                          initargs=(mdp, env_factory))
+
+    def evaluate(self, policy, metric='discounted', initial_states=None,
+                 n_episodes=1, seed=None):
+        """
+        Evaluate the policy, see evaluate_policy. If seed is given, the
+        episodes are seeded as in evaluate_policy with the same seed.
+        Return:
+            metric (float): the selected evaluation metric
+            confidence (float): 95% confidence level for the provided metric
+            step (float): average number of step before finish
+            step_confidence (float):  95% confidence level for step average
+        """
+        assert metric in ['discounted', 'average'], "unsupported metric"
+        path = self._broadcast(policy)
+
+        if initial_states is not None:
+            n_episodes = initial_states.shape[0] \
+                if len(initial_states.shape) > 1 else 1
+        n_chunks = int(np.ceil(n_episodes / float(self.n_episodes_per_job)))
+        rng = self.mdp.np_random if hasattr(self.mdp, 'np_random') \
+            else np.random
+        seeds = rng.randint(2 ** 31, size=n_chunks)
+        episode_seeds = np.array_split(_episode_seeds(seed, n_episodes),
+                                       n_chunks) if seed is not None \
+            else [None] * n_chunks
+        if initial_states is not None:
+            chunks = np.array_split(initial_states.reshape(n_episodes, -1),
+                                    n_chunks)
+            sizes = [c.shape[0] for c in chunks]
+        else:
+            chunks = [None] * n_chunks
+            sizes = [len(c) for c in np.array_split(np.arange(n_episodes),
+                                                    n_chunks)]
+        out = self._pool.map(_eval_task,
+                             [(path, metric, chunk, size, int(seed),
+                               chunk_seeds)
+                              for chunk, size, seed, chunk_seeds in
+                              zip(chunks, sizes, seeds, episode_seeds)])
+
+        values = np.concatenate([o[0] for o in out])
+        steps = np.concatenate([o[1] for o in out])
+        return values.mean(), 2 * values.std() / np.sqrt(n_episodes), \
+            steps.mean(), 2 * steps.std() / np.sqrt(n_episodes)
+
+    def close(self):
+        """
+        Stop the processes and remove the policy snapshots.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _broadcast(self, policy):
+        """
+        Write a snapshot of the policy unless it is the version of the last
+        snapshot (see Algorithm._new_version). Policies without a version
+        are written each time.
+        Returns:
+            the path of the snapshot
+        """
+        version = getattr(policy, '_version', None)
+        if self._snapshot is not None and version is not None and \
+                version == self._version:
+            return self._snapshot
+
+        path = os.path.join(self._dir,
+                            'policy_{}.pkl'.format(self._n_snapshots))
+        with open(path, 'wb') as f:
+            pickle.dump(_strip(policy), f, pickle.HIGHEST_PROTOCOL)
+        if self._snapshot is not None:
+            os.remove(self._snapshot)
+        self._n_snapshots += 1
+        self._snapshot = path
+        self._version = version
+
+        return path
+
+
+def _strip(policy):
+    """
+    Shallow copy of the policy without the training data and, if the policy
+    predicts with its compiled estimator, without the original estimator.
+    The policies it holds (e.g., the policy evaluated by FQE) are stripped
+    in the same way.
+    """
+    snapshot = copy(policy)
+    for name in _TRAINING_ATTRIBUTES:
+        if hasattr(snapshot, name):
+            setattr(snapshot, name, None)
+    if getattr(snapshot, '_predictor', None) is not None:
+        snapshot._estimator = None
+    for name, value in list(vars(snapshot).items()):
+        if value is not policy and hasattr(value, 'draw_action'):
+            setattr(snapshot, name, _strip(value))
+
+    return snapshot
+
+
+def _init_worker(mdp, env_factory):
+    _worker['mdp'] = env_factory() if env_factory is not None else mdp
+    _worker['path'] = None
+
+
+def _eval_task(args):
+    path, metric, initial_states, n_episodes, seed, episode_seeds = args
+    if _worker['path'] != path:
+        with open(path, 'rb') as f:
+            _worker['policy'] = pickle.load(f)
+        _worker['path'] = path
+    mdp = _worker['mdp']
+    _seed_env(mdp, seed)
+    _seed_global(seed)
+
+    return _eval_and_render_vectorial(mdp, _worker['policy'], metric,
+                                      initial_states, n_episodes, False,
+                                      episode_seeds)
@@ -0,0 +1,141 @@
+from __future__ import print_function
+from timeit import default_timer
+
+import numpy as np
+
+"""
+Time spent by the evaluation and the collection of episodes in the
+environment, in the policy and in the rest of the loop.
+"""
+
+
+class EpisodeProfiler(object):
+    """
+    Profiler of the episodes run by evaluate_policy or collect_episodes.
+    The environment and the policy are wrapped so that the time spent in
+    reset and step and in draw_action is measured at each call; the rest of
+    the time of each episode is counted as bookkeeping (e.g., accumulating
+    the return, recording the transitions). When no profiler is given the
+    episodes run on the original objects, without any timing.
+    """
+
+    def __init__(self):
+        self._episodes = list()
+        self._env = 0.
+        self._policy = 0.
+        self._start = None
+
+    def wrap(self, mdp, policy):
+        """
+        Returns:
+            the environment and the policy timed by this profiler (policy
+            may be None)
+        """
+        return _TimedEnv(mdp, self), \
+            None if policy is None else _TimedPolicy(policy, self)
+
+    def start_episode(self):
+        self._env = 0.
+        self._policy = 0.
+        self._start = default_timer()
+
+    def end_episode(self, n_steps):
+        total = default_timer() - self._start
+        self._episodes.append((n_steps, self._env, self._policy,
+                               total - self._env - self._policy, total))
+
+    def reset(self):
+        """
+        Forget the episodes profiled so far.
+        """
+        self._episodes = list()
+
+    def report(self):
+        """
+        Returns:
+            a dictionary with:
+                - 'n_episodes', 'n_steps': number of episodes and of steps
+                - 'total': time (in seconds) spent in the environment
+                  ('env'), in the policy ('policy'), in the rest of the loop
+                  ('other') and overall ('total')
+                - 'per_step': the same times divided by the number of steps
+                - 'episodes': the number of steps ('steps') and the times of
+                  each episode, as arrays
+        """
+        columns = np.array(self._episodes, dtype=float).reshape(-1, 5)
+        names = ('env', 'policy', 'other', 'total')
+        episodes = dict(zip(('steps',) + names, columns.T))
+        n_steps = int(columns[:, 0].sum())
+        total = dict((n, episodes[n].sum()) for n in names)
+
+        return {'n_episodes': columns.shape[0],
+                'n_steps': n_steps,
+                'total': total,
+                'per_step': dict((n, total[n] / max(n_steps, 1))
+                                 for n in names),
+                'episodes': episodes}
+
+    def summary(self):
+        """
+        Returns:
+            the totals of the report as a printable table
+        """
+        report = self.report()
+        lines = ['{} episodes, {} steps'.format(report['n_episodes'],
+                                                report['n_steps']),
+                 '{:<8}{:>12}{:>14}{:>8}'.format('', 'total [s]',
+                                                 'per step [ms]', '%')]
+        for name in ('env', 'policy', 'other', 'total'):
+            t = report['total'][name]
+            lines.append('{:<8}{:>12.3f}{:>14.3f}{:>8.1f}'.format(
+                name, t, 1000 * report['per_step'][name],
+                100 * t / max(report['total']['total'], 1e-12)))
+
+        return '\n'.join(lines)
+
+
+class _TimedEnv(object):
+    """
+    Environment measuring the time spent in reset and step.
+    """
+
+    def __init__(self, mdp, profiler):
+        self._mdp = mdp
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._mdp, name)
+
+    def reset(self, *args, **kwargs):
+        tic = default_timer()
+        out = self._mdp.reset(*args, **kwargs)
+        self._profiler._env += default_timer() - tic
+
+        return out
+
+    def step(self, *args, **kwargs):
+        tic = default_timer()
+        out = self._mdp.step(*args, **kwargs)
+        self._profiler._env += default_timer() - tic
+
+        return out
+
+
+class _TimedPolicy(object):
+    """
+    Policy measuring the time spent in draw_action.
+    """
+
+    def __init__(self, policy, profiler):
+        self._policy = policy
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._policy, name)
+
+    def draw_action(self, *args, **kwargs):
+        tic = default_timer()
+        out = self._policy.draw_action(*args, **kwargs)
+        self._profiler._policy += default_timer() - tic
+
+        return out
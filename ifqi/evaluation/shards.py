@@ -0,0 +1,191 @@
+import json
+import os
+
+import numpy as np
+
+"""
+Datasets streamed to disk as fixed-size .npy shards.
+"""
+
+MANIFEST = 'manifest.json'
+
+
+class ShardWriter(object):
+    """
+    Writer of transitions to a directory of .npy shards of shard_size rows
+    each (the last one may be shorter). The rows have the dataset layout
+    [state, action, reward, next state, absorbing, end]. Only the shard being
+    filled is kept in memory. The manifest (manifest.json) lists the shards
+    and the row index where each episode ends; it is rewritten each time a
+    shard is flushed, so that it always describes the shards on disk.
+    """
+
+    def __init__(self, path, shard_size=100000):
+        """
+        Constructor.
+        Args:
+            path (str): directory of the shards, created if needed
+            shard_size (int, 100000): number of rows of each shard
+        """
+        self.path = path
+        self.shard_size = shard_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._chunk = None
+        self._n = 0
+        self._shards = list()
+        self._shard_rows = list()
+        self._episode_ends = list()
+        self._n_rows = 0
+
+    def add(self, state, action, reward, next_state, absorbing, end):
+        """
+        Append a transition.
+        """
+        values = (np.ravel(state), np.ravel(action), np.ravel(reward),
+                  np.ravel(next_state), absorbing, end)
+        if self._chunk is None:
+            bounds = np.cumsum([0] + [np.size(v) for v in values])
+            self._slices = [slice(bounds[i], bounds[i + 1])
+                            for i in range(len(values))]
+            self._chunk = np.empty((self.shard_size, bounds[-1]))
+        row = self._chunk[self._n]
+        for s, v in zip(self._slices, values):
+            row[s] = v
+        self._n += 1
+        self._n_rows += 1
+        if end:
+            self._episode_ends.append(self._n_rows)
+        if self._n == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the rows added since the last flush as a new shard.
+        """
+        if self._n > 0:
+            name = 'shard_{:06d}.npy'.format(len(self._shards))
+            np.save(os.path.join(self.path, name), self._chunk[:self._n])
+            self._shards.append(name)
+            self._shard_rows.append(self._n)
+            self._n = 0
+
+        manifest = {'n_rows': self._n_rows,
+                    'n_columns': 0 if self._chunk is None
+                    else self._chunk.shape[1],
+                    'shard_size': self.shard_size,
+                    'shards': self._shards,
+                    'shard_rows': self._shard_rows,
+                    'episode_ends': self._episode_ends}
+        with open(os.path.join(self.path, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardedArray(object):
+    """
+    Read-only view of the shards of a dataset as a single (n_rows x
+    n_columns) array. The shards are memory-mapped: rows are read from disk
+    only when accessed and row slices within a shard are returned without
+    copies.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor.
+        Args:
+            path (str): directory of the shards
+        """
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.path = path
+        self._shards = [np.load(os.path.join(path, name), mmap_mode='r')
+                        for name in manifest['shards']]
+        self._offsets = np.cumsum([0] + manifest['shard_rows'])
+        self.shape = (int(self._offsets[-1]), manifest['n_columns'])
+        self.dtype = np.dtype(float)
+        self.episode_ends = np.array(manifest['episode_ends'], dtype=int)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def n_episodes(self):
+        return self.episode_ends.shape[0]
+
+    def episode(self, i):
+        """
+        Returns:
+            the rows of the i-th episode
+        """
+        start = self.episode_ends[i - 1] if i > 0 else 0
+
+        return self[start:self.episode_ends[i]]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, columns = key[0], key[1:]
+        else:
+            rows, columns = key, ()
+        if isinstance(rows, slice) and rows.step in (None, 1):
+            start, stop, _ = rows.indices(self.shape[0])
+            stop = max(start, stop)
+            first = np.searchsorted(self._offsets, start, side='right') - 1
+            if first < len(self._shards) and \
+                    stop <= self._offsets[first + 1]:
+                # within a shard: view on the memory map
+                out = self._shards[first][start - self._offsets[first]:
+                                          stop - self._offsets[first]]
+            else:
+                out = self._take(np.arange(start, stop))
+        elif np.isscalar(rows):
+            if rows < 0:
+                rows += self.shape[0]
+            out = self._take(np.array([rows]))[0]
+            return out[columns] if columns else out
+        else:
+            out = self._take(np.arange(self.shape[0])[rows])
+
+        return out[(slice(None),) + columns] if columns else out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:] if len(self._shards) == 1 else \
+            np.concatenate(self._shards, axis=0) if self._shards else \
+            np.zeros(self.shape)
+
+        return np.asarray(out, dtype=dtype)
+
+    def _take(self, idxs):
+        """
+        Gather the given rows (a copy) from the shards.
+        """
+        out = np.empty((idxs.shape[0], self.shape[1]))
+        shard = np.searchsorted(self._offsets, idxs, side='right') - 1
+        for s in np.unique(shard):
+            mask = shard == s
+            out[mask] = self._shards[s][idxs[mask] - self._offsets[s]]
+
+        return out
+
+
+def load_shards(path):
+    """
+    Load the dataset written by a ShardWriter.
+    Args:
+        path (str): directory of the shards
+    Returns:
+        a ShardedArray view of the dataset
+    """
+    return ShardedArray(path)
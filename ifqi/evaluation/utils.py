@@ -2,23 +2,94 @@ from __future__ import print_function
 import numpy as np
 
 
-def check_dataset(data, state_dim, action_dim, reward_dim):
+def check_dataset(data, state_dim, action_dim, reward_dim, chunk_size=100000):
+    """
+    Check that the dataset is consistent: the values are finite, the
+    absorbing and end flags are 0 or 1 (an absorbing transition ending the
+    episode) and, inside an episode, each next state is the state of the
+    following transition.
+    Args:
+        data (np.array): the dataset [s, a, r, s', absorbing, end]; it can
+                         be a memory-mapped array (e.g., a ShardedArray)
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        chunk_size (int, 100000): number of rows checked at once
+    Raises:
+        AssertionError: if the dataset is not consistent, reporting the
+                        offending rows
+    """
+    errors = dataset_errors(data, state_dim, action_dim, reward_dim,
+                            chunk_size)
+    messages = list()
+    for name, description in (('nonfinite', 'non-finite values'),
+                              ('flags', 'invalid absorbing/end flags'),
+                              ('transition',
+                               'next state different from the next row '
+                               'state')):
+        rows = errors[name]
+        if rows.shape[0] > 0:
+            messages.append('{}: {} rows {}{}'.format(
+                description, rows.shape[0], rows[:10].tolist(),
+                '...' if rows.shape[0] > 10 else ''))
+    assert len(messages) == 0, '; '.join(messages)
+
+
+def dataset_errors(data, state_dim, action_dim, reward_dim, chunk_size=100000,
+                   rtol=1e-05, atol=1e-08):
+    """
+    Find the inconsistent rows of the dataset. The dataset is read in chunks
+    of consecutive rows, and each chunk is checked with array operations:
+    the next states of a chunk are compared with the states shifted by one
+    row (the first row of the following chunk included).
+    Args:
+        data (np.array): the dataset [s, a, r, s', absorbing, end]
+        state_dim (int): state dimensionality
+        action_dim (int): action dimensionality
+        reward_dim (int): reward dimensionality
+        chunk_size (int, 100000): number of rows checked at once
+        rtol (float, 1e-05): relative tolerance of the comparison of the
+                             states, as in np.allclose
+        atol (float, 1e-08): absolute tolerance of the comparison of the
+                             states, as in np.allclose
+    Returns:
+        a dictionary with the sorted indices of the rows:
+            - 'nonfinite': containing NaN or inf values
+            - 'flags': whose absorbing or end flag is not 0 or 1, or that
+              are absorbing without ending the episode
+            - 'transition': that do not end the episode and whose next
+              state is not the state of the following row
+    """
     n_columns = 2 * state_dim + action_dim + reward_dim + 2
     assert data.shape[1] == n_columns, \
         '{} != {}'.format(data.shape[1], n_columns)
-
-    state_mask = np.zeros(n_columns, dtype=bool)
-    state_mask[:state_dim] = True
-    nextstate_mask = np.zeros(n_columns, dtype=bool)
     nextstate_idx = state_dim + action_dim + reward_dim
-    nextstate_mask[nextstate_idx:nextstate_idx + state_dim] = True
-
-    for i in range(data.shape[0] - 1):
-        snext = data[i, nextstate_mask]
-        end_ep = data[i, -1]
-        s = data[i + 1, state_mask]
-        assert np.allclose(s, snext) or end_ep == 1, \
-            '{} != {}'.format(s, snext)
+    n_rows = data.shape[0]
+
+    errors = {'nonfinite': list(), 'flags': list(), 'transition': list()}
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        # one more row, to compare the last next state of the chunk
+        chunk = np.asarray(data[start:min(stop + 1, n_rows)])
+        rows = chunk[:stop - start]
+
+        errors['nonfinite'].append(
+            np.flatnonzero(~np.isfinite(rows).all(axis=1)) + start)
+
+        absorbing, end = rows[:, -2], rows[:, -1]
+        bad_flags = ((absorbing != 0) & (absorbing != 1)) | \
+            ((end != 0) & (end != 1)) | ((absorbing == 1) & (end != 1))
+        errors['flags'].append(np.flatnonzero(bad_flags) + start)
+
+        snext = chunk[:-1, nextstate_idx:nextstate_idx + state_dim]
+        s = chunk[1:, :state_dim]
+        close = (np.abs(s - snext) <= atol + rtol * np.abs(snext)).all(axis=1)
+        errors['transition'].append(
+            np.flatnonzero(~close & (end[:s.shape[0]] != 1)) + start)
+
+    return dict((name, np.concatenate(rows).astype(int) if rows
+                 else np.zeros(0, dtype=int))
+                for name, rows in errors.items())
 
 
 def split_dataset(dataset, state_dim, action_dim, reward_dim):
@@ -1,5 +1,8 @@
 from .actionregressor import ActionRegressor
+from .compiledforest import CompiledActionRegressor, CompiledForest, \
+    compile_forest
 from .ensemble import Ensemble
 from .regressor import Regressor
 
-__all__ = ['ActionRegressor', 'Ensemble', 'Regressor']
+__all__ = ['ActionRegressor', 'CompiledActionRegressor', 'CompiledForest',
+           'Ensemble', 'Regressor', 'compile_forest']
@@ -2,6 +2,7 @@ from builtins import range
 from copy import deepcopy
 
 import numpy as np
+import scipy.sparse as sp
 
 from ifqi.models.ensemble import Ensemble
 
@@ -61,16 +62,18 @@ class ActionRegressor(object):
         Split the input data according to the contained action. Each new set
         is used to fit the associated model.
         Parameters:
-            X (np.array): Training data. Last column must contain the action
-                          (it is used as splitting criteria).
+            X (np.array, sparse matrix): Training data. Last column must
+                          contain the action (it is used as splitting
+                          criteria).
                           Dimensions: n_samplex x n_features
             y (np.array): Target values. Dimensions: n_samples x 1
             **kwargs: additional parameters to be passed to the fit function of
                       the estimator
         """
+        X_actions = _action_column(X)
         for i in range(len(self._models)):
             action = self._actions[i]
-            idxs = np.all(X[:, -1:] == action, axis=1)
+            idxs = np.all(X_actions == action, axis=1)
 
             self._models[i].fit(X[idxs, :-1], y[idxs], **kwargs)
 
@@ -81,8 +84,8 @@ class ActionRegressor(object):
         x.
 
         Parameters:
-            x (np.array): Test point. Last column must contain the action
-                          (it is used to select the estimator).
+            x (np.array, sparse matrix): Test point. Last column must contain
+                          the action (it is used to select the estimator).
                           Dimensions: 1 x n_features
             **kwargs: additional parameters to be passed to the
                       predict function of the estimator
@@ -92,9 +95,10 @@ class ActionRegressor(object):
         """
 
         predictions = np.zeros(x.shape[0])
+        x_actions = _action_column(x)
         for i in range(self._actions.shape[0]):
             action = self._actions[i]
-            idxs = np.all(x[:, -1:] == action, axis=1)
+            idxs = np.all(x_actions == action, axis=1)
 
             if np.any(idxs):
                 p = self._models[i].predict(x[idxs, :-1], **kwargs)
@@ -127,3 +131,13 @@ class ActionRegressor(object):
             models.append(deepcopy(model))
 
         return models
+
+
+def _action_column(X):
+    """
+    Dense copy of the last column of X, that contains the action.
+    """
+    if sp.issparse(X):
+        return X[:, -1:].toarray()
+
+    return X[:, -1:]
@@ -0,0 +1,431 @@
+from builtins import range
+
+import numpy as np
+
+from ifqi.models.actionregressor import ActionRegressor
+from ifqi.models.ensemble import Ensemble
+from ifqi.models.regressor import Regressor
+
+"""
+Compiled tree-ensemble inference.
+A fitted tree-based model (a scikit-learn tree or forest, possibly wrapped
+in a Regressor, an Ensemble or an ActionRegressor) is flattened into a set
+of contiguous node arrays. Prediction traverses all the trees for the whole
+batch of samples one level at a time, avoiding the per-tree Python overhead
+of scikit-learn.
+"""
+
+
+class CompiledForest(object):
+    """
+    Array representation of a set of regression trees whose predictions are
+    summed. Each tree belongs to a group sharing the same input
+    standardization; the (weighted) average of the trees of a forest and the
+    output standardization are folded in the leaf values and in the bias.
+    Leaves point to themselves.
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right,
+                 value, roots, tree_group, max_depth, x_mean=None,
+                 x_scale=None, bias=0., dtype='float32'):
+        """
+        Constructor.
+        Args:
+            feature (np.array): feature tested in each node
+            threshold (np.array): threshold of each node (x <= t goes left)
+            children_left (np.array): left child of each node
+            children_right (np.array): right child of each node
+            value (np.array): weighted output of each node
+            roots (np.array): index of the root node of each tree
+            tree_group (np.array): input group of each tree
+            max_depth (int): maximum depth of the trees
+            x_mean (np.array, None): input mean of each group.
+                                     Dimensions: (n_groups x n_features)
+            x_scale (np.array, None): input scale of each group.
+                                      Dimensions: (n_groups x n_features)
+            bias (float, 0.): constant added to the sum of the trees
+            dtype (str, 'float32'): type the inputs are cast to before being
+                                    compared with the thresholds
+        """
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.children_left = np.ascontiguousarray(children_left,
+                                                  dtype=np.intp)
+        self.children_right = np.ascontiguousarray(children_right,
+                                                   dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.tree_group = np.ascontiguousarray(tree_group, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.x_mean = x_mean
+        self.x_scale = x_scale
+        self.bias = float(bias)
+        self.dtype = np.dtype(dtype)
+
+        # interleaved children (left, right) and leaf mask for the traversal
+        self._children = np.column_stack(
+            (self.children_left, self.children_right)).ravel()
+        self._leaf = self.children_left == np.arange(self.n_nodes)
+
+    @property
+    def n_trees(self):
+        return self.roots.shape[0]
+
+    @property
+    def n_nodes(self):
+        return self.feature.shape[0]
+
+    @property
+    def n_groups(self):
+        return int(self.tree_group.max()) + 1 if self.n_trees > 0 else 0
+
+    def predict(self, x, **kwargs):
+        """
+        Predict the target of the samples in x. Additional keyword arguments
+        are accepted and ignored for compatibility with the predict
+        function of the other models.
+
+        Args:
+            x (np.array): test points. Dimensions: n_samples x n_features
+            **kwargs: ignored
+        Returns:
+            output (np.array): target associated to each sample
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        n_samples = x.shape[0]
+        predictions = np.empty(n_samples)
+        if self.n_trees == 0:
+            predictions.fill(self.bias)
+            return predictions
+
+        # bound the size of the (n_samples x n_trees) traversal matrices
+        chunk = max(1, (1 << 18) // self.n_trees)
+        for start in range(0, n_samples, chunk):
+            stop = min(start + chunk, n_samples)
+            predictions[start:stop] = self._predict_chunk(x[start:stop])
+
+        return predictions
+
+    def _predict_chunk(self, x):
+        n_samples, n_features = x.shape
+        n_groups = self.n_groups
+
+        # input of each group, flattened to allow a single gather per level
+        if self.x_mean is None:
+            groups = x.astype(self.dtype)[np.newaxis]
+        else:
+            groups = ((x[np.newaxis] - self.x_mean[:, np.newaxis]) /
+                      self.x_scale[:, np.newaxis]).astype(self.dtype)
+        groups = groups.ravel()
+
+        # offset of the row of sample i in the input of the group of tree t
+        if n_groups == 1:
+            row = (np.arange(n_samples) * n_features)[:, np.newaxis]
+        else:
+            row = (self.tree_group[np.newaxis] * n_samples +
+                   np.arange(n_samples)[:, np.newaxis]) * n_features
+
+        # descend all the (sample, tree) pairs that are not in a leaf yet
+        row = np.broadcast_to(row, (n_samples, self.n_trees)).ravel()
+        nodes = np.tile(self.roots, n_samples)
+        active = np.flatnonzero(~self._leaf[nodes])
+        while active.size > 0:
+            current = nodes[active]
+            go_right = groups[row[active] + self.feature[current]] > \
+                self.threshold[current]
+            current = self._children[2 * current + go_right]
+            nodes[active] = current
+            active = active[~self._leaf[current]]
+
+        return self.value[nodes].reshape(n_samples, -1).sum(axis=1) + \
+            self.bias
+
+    def save(self, path):
+        """
+        Store the compiled forest in a compressed .npz file. Node indices and
+        features are stored with the smallest integer type able to hold them.
+
+        Args:
+            path (str, file): destination file
+        """
+        np.savez_compressed(path, **self._to_arrays())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a compiled forest stored with save.
+
+        Args:
+            path (str, file): source file
+        Returns:
+            the compiled forest
+        """
+        data = np.load(path)
+
+        return cls._from_arrays(dict((k, data[k]) for k in data.files))
+
+    def _to_arrays(self):
+        n_features = self.feature.max() + 1 if self.n_nodes > 0 else 1
+        arrays = dict(feature=self.feature.astype(_index_type(n_features)),
+                      threshold=self.threshold,
+                      children_left=self.children_left.astype(
+                          _index_type(self.n_nodes)),
+                      children_right=self.children_right.astype(
+                          _index_type(self.n_nodes)),
+                      value=self.value,
+                      roots=self.roots.astype(_index_type(self.n_nodes)),
+                      tree_group=self.tree_group.astype(
+                          _index_type(self.n_groups)),
+                      max_depth=np.array(self.max_depth),
+                      bias=np.array(self.bias),
+                      dtype=np.array(self.dtype.str))
+        if self.x_mean is not None:
+            arrays['x_mean'] = self.x_mean
+            arrays['x_scale'] = self.x_scale
+
+        return arrays
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        return cls(arrays['feature'], arrays['threshold'],
+                   arrays['children_left'], arrays['children_right'],
+                   arrays['value'], arrays['roots'], arrays['tree_group'],
+                   int(arrays['max_depth']), x_mean=arrays.get('x_mean'),
+                   x_scale=arrays.get('x_scale'),
+                   bias=float(arrays['bias']), dtype=str(arrays['dtype']))
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """
+        Compile a fitted tree-based estimator. Supported estimators are
+        scikit-learn trees and forests (i.e., having a tree_ or an
+        estimators_ attribute), Regressor and Ensemble objects wrapping them.
+
+        Args:
+            estimator (object): the fitted estimator
+        Returns:
+            the compiled forest
+        """
+        parts = list()
+        _collect_parts(estimator, parts)
+
+        return _merge_parts(parts)
+
+
+class CompiledActionRegressor(object):
+    """
+    Compiled counterpart of ActionRegressor. It stores a compiled forest for
+    each discrete action and dispatches the samples according to the action
+    contained in their last column.
+    """
+
+    def __init__(self, actions, forests):
+        """
+        Constructor.
+        Args:
+            actions (np.array): the discrete actions
+            forests (list): the compiled forest associated to each action
+        """
+        assert len(actions) == len(forests)
+        self._actions = np.asarray(actions)
+        self._forests = forests
+
+    def predict(self, x, **kwargs):
+        """
+        Predict the target for the samples in x using the forest associated
+        to the action contained in the last column of x.
+
+        Args:
+            x (np.array): test points. Last column must contain the action.
+                          Dimensions: n_samples x n_features
+            **kwargs: ignored
+        Returns:
+            output (np.array): target associated to each sample
+        """
+        predictions = np.zeros(x.shape[0])
+        for i in range(self._actions.shape[0]):
+            idxs = np.all(x[:, -1:] == self._actions[i], axis=1)
+
+            if np.any(idxs):
+                predictions[idxs] = self._forests[i].predict(x[idxs, :-1])
+
+        return predictions
+
+    def save(self, path):
+        """
+        Store the compiled forests in a compressed .npz file.
+
+        Args:
+            path (str, file): destination file
+        """
+        arrays = dict(actions=self._actions)
+        for i, forest in enumerate(self._forests):
+            for k, v in forest._to_arrays().items():
+                arrays['forest_{}/{}'.format(i, k)] = v
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load compiled forests stored with save.
+
+        Args:
+            path (str, file): source file
+        Returns:
+            the compiled action regressor
+        """
+        data = np.load(path)
+        actions = data['actions']
+        forests = list()
+        for i in range(actions.shape[0]):
+            prefix = 'forest_{}/'.format(i)
+            arrays = dict((k[len(prefix):], data[k]) for k in data.files
+                          if k.startswith(prefix))
+            forests.append(CompiledForest._from_arrays(arrays))
+
+        return cls(actions, forests)
+
+
+def compile_forest(estimator):
+    """
+    Compile a fitted tree-based estimator into its array representation. The
+    returned object exposes the same predict function of the estimator and
+    can be used in its place for inference.
+
+    Args:
+        estimator (object): a fitted Regressor, Ensemble or ActionRegressor
+                            (or a scikit-learn tree or forest)
+    Returns:
+        the compiled estimator
+    """
+    if isinstance(estimator, ActionRegressor):
+        forests = [CompiledForest.from_estimator(m)
+                   for m in estimator._models]
+        return CompiledActionRegressor(estimator._actions, forests)
+
+    return CompiledForest.from_estimator(estimator)
+
+
+def _collect_parts(estimator, parts, x_scalers=(), y_scale=1.):
+    """
+    Recursively collect the trees contained in the estimator. Each part is a
+    tuple (trees, weight, x_scalers, y_scale, y_mean), where x_scalers are
+    the input scalers applied before the trees, from the outermost one, and
+    y_scale and y_mean map the sum of the trees to the output of the
+    estimator. The output mean of each Regressor is collected once, as a
+    part without trees, scaled by the Regressors wrapping it.
+    """
+    if isinstance(estimator, Ensemble):
+        for model in estimator._models:
+            _collect_parts(model, parts, x_scalers, y_scale)
+    elif isinstance(estimator, Regressor):
+        if estimator._input_scaled:
+            x_scalers = x_scalers + (estimator._pre_X,)
+        if estimator._output_scaled:
+            parts.append(([], 0., x_scalers, 1., y_scale * float(
+                np.ravel(estimator._pre_y.mean_)[0])))
+            y_scale = y_scale * float(np.ravel(estimator._pre_y.scale_)[0])
+        _collect_parts(estimator._regressor, parts, x_scalers, y_scale)
+    elif hasattr(estimator, 'estimators_'):
+        trees = [e.tree_ for e in np.ravel(estimator.estimators_)]
+        parts.append((trees, 1. / len(trees), x_scalers, y_scale, 0.))
+    elif hasattr(estimator, 'tree_'):
+        parts.append(([estimator.tree_], 1., x_scalers, y_scale, 0.))
+    else:
+        raise ValueError('Such estimator cannot be compiled')
+
+
+def _compose_scalers(x_scalers):
+    """
+    Returns:
+        the mean and scale of the standardization equivalent to applying
+        the given scalers in order, or None if there are none
+    """
+    if len(x_scalers) == 0:
+        return None
+    mean, scale = 0., 1.
+    for s in x_scalers:
+        # ((x - mean) / scale - m) / s = (x - (mean + scale * m)) / (scale * s)
+        mean = mean + scale * (s.mean_ if s.with_mean else 0.)
+        scale = scale * (s.scale_ if s.with_std else 1.)
+
+    return mean, scale
+
+
+def _merge_parts(parts):
+    feature, threshold, left, right, value = [], [], [], [], []
+    roots, tree_group = [], []
+    scalers, x_mean, x_scale = [], [], []
+    bias = 0.
+    max_depth = 0
+    offset = 0
+    for trees, weight, x_scalers, y_scale, y_mean in parts:
+        bias += y_mean
+        if len(trees) == 0:
+            continue
+        # trees sharing the same input scalers share the same group
+        group = [i for i, s in enumerate(scalers)
+                 if len(s) == len(x_scalers) and
+                 all(a is b for a, b in zip(s, x_scalers))]
+        if group:
+            group = group[0]
+        else:
+            group = len(scalers)
+            scalers.append(x_scalers)
+        for tree in trees:
+            n_nodes = tree.node_count
+            nodes = np.arange(n_nodes)
+            leaves = tree.children_left[:n_nodes] < 0
+
+            f = np.array(tree.feature[:n_nodes])
+            f[leaves] = 0
+            t = np.array(tree.threshold[:n_nodes])
+            t[leaves] = 0.
+            l = np.where(leaves, nodes, tree.children_left[:n_nodes])
+            r = np.where(leaves, nodes, tree.children_right[:n_nodes])
+
+            feature.append(f)
+            threshold.append(t)
+            left.append(l + offset)
+            right.append(r + offset)
+            value.append(np.ravel(tree.value[:n_nodes, 0, 0]) * weight *
+                         y_scale)
+            roots.append(offset)
+            tree_group.append(group)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n_nodes
+
+    scalers = [_compose_scalers(s) for s in scalers]
+    if any(s is not None for s in scalers):
+        for s in scalers:
+            if s is None:
+                x_mean.append(0.)
+                x_scale.append(1.)
+            else:
+                x_mean.append(s[0])
+                x_scale.append(s[1])
+        n_features = max(np.size(m) for m in x_mean)
+        x_mean = np.array([np.ones(n_features) * m for m in x_mean])
+        x_scale = np.array([np.ones(n_features) * s for s in x_scale])
+    else:
+        x_mean = x_scale = None
+
+    if len(roots) == 0:
+        empty = np.zeros(0)
+        return CompiledForest(empty, empty, empty, empty, empty, empty,
+                              empty, 0, bias=bias)
+
+    return CompiledForest(np.concatenate(feature), np.concatenate(threshold),
+                          np.concatenate(left), np.concatenate(right),
+                          np.concatenate(value), np.array(roots),
+                          np.array(tree_group), max_depth, x_mean=x_mean,
+                          x_scale=x_scale, bias=bias)
+
+
+def _index_type(n):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
@@ -1,3 +1,4 @@
+import scipy.sparse as sp
 import sklearn.preprocessing as preprocessing
 
 
@@ -9,7 +10,9 @@ class Regressor:
 
     def fit(self, X, y, **kwargs):
         if self._input_scaled:
-            self._pre_X = preprocessing.StandardScaler()
+            # sparse inputs can only be scaled, not centered
+            self._pre_X = preprocessing.StandardScaler(
+                with_mean=not sp.issparse(X))
             X = self._pre_X.fit_transform(X)
 
         if self._output_scaled:
@@ -27,3 +30,26 @@ class Regressor:
             y = self._pre_y.inverse_transform(y).ravel()
 
         return y
+
+    def has_max_action(self):
+        """
+        Whether the wrapped model maximizes the Q-function over the actions
+        in closed form. Scaled models are excluded, as their maximizer is
+        computed on the unscaled inputs and outputs.
+        """
+        return hasattr(self._regressor, 'max_action') and \
+            not self._input_scaled and not self._output_scaled
+
+    def has_population_predict(self):
+        """
+        Whether the wrapped model predicts the Q-values for several
+        parameter vectors in one call (f_rhos parameter of predict,
+        returning a (n_thetas x n_samples) array), as declared by its
+        population_predict attribute. Models with scaled outputs are
+        excluded, as the scaler expects a single column.
+        """
+        return getattr(self._regressor, 'population_predict', False) and \
+            not self._output_scaled
+
+    def max_action(self, states, **kwargs):
+        return self._regressor.max_action(states, **kwargs)
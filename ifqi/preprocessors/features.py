@@ -1,27 +1,395 @@
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
+import scipy.sparse as sp
 from sklearn.preprocessing import PolynomialFeatures
 
 
-def select_features(f):
-    if f is None:
+def select_features(f, action_dim=1):
+    """
+    Build the features described by f.
+    Args:
+        f (dict, None): description of the features. The key 'name' selects
+                        the kind of features, the other keys are their
+                        parameters
+        action_dim (int, 1): action dimensionality
+    Returns:
+        the features object, None if no features are required
+    """
+    if f is None or not f.get('name'):
         return None
     elif f['name'] == 'poly':
-        return PolyFeatures(f['degree'])
+        return PolyFeatures(f['degree'], action_dim=action_dim)
+    elif f['name'] == 'rbf':
+        return RBFFeatures(f['n_centers'], width=f.get('width', 1.),
+                           radius=f.get('radius'), low=f.get('low'),
+                           high=f.get('high'), action_dim=action_dim)
+    elif f['name'] == 'fourier':
+        return RandomFourierFeatures(f['n_components'],
+                                     bandwidth=f.get('bandwidth', 1.),
+                                     random_state=f.get('random_state'),
+                                     action_dim=action_dim)
+    elif f['name'] == 'tile':
+        return TileCoding(f['n_tilings'], f['n_tiles'], low=f.get('low'),
+                          high=f.get('high'),
+                          random_state=f.get('random_state'),
+                          action_dim=action_dim)
     else:
         raise ValueError('unknown feature type.')
 
 
-class PolyFeatures(object):
-    def __init__(self, degree):
-        self.degree = degree
-        self.poly = PolynomialFeatures(self.degree)
+class Features(object):
+    """
+    Base class of the features of [state, action] samples. The features of
+    the states are computed by the subclasses (transform) and the action
+    columns are appended to them unchanged (combine), so that the action is
+    still in the last column as required by ActionRegressor. State features
+    can be scipy.sparse CSR matrices, in which case the samples are CSR
+    matrices too.
+    The state features are cached, keyed by the content of the array of
+    states they have been computed from, so that the same states (e.g., the
+    next states of the dataset queried by maxQA for each action and at each
+    iteration) are expanded only once.
+    """
+
+    def __init__(self, action_dim=1, cache_size=4):
+        """
+        Constructor.
+        Args:
+            action_dim (int, 1): action dimensionality
+            cache_size (int, 4): number of state arrays whose features are
+                                 kept in the cache
+        """
+        self.action_dim = action_dim
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
 
     def __call__(self, X):
-        return np.concatenate((self.poly.fit_transform(X[:, :-1]),
-                               X[:, -1].reshape(-1, 1)),
-                              axis=1)
+        """
+        Fit the features on the states in X and return the features of X.
+        Args:
+            X (np.array): [state, action] samples
+        Returns:
+            the features of the samples
+        """
+        states, actions = self._split(X)
+        self.fit(states)
+
+        return self.combine(self.state_features(states), actions)
 
     def test_features(self, x):
-        return np.concatenate((self.poly.transform(x[:, :-1]),
-                               x[:, -1].reshape(-1, 1)),
-                              axis=1)
+        """
+        Args:
+            x (np.array): [state, action] samples
+        Returns:
+            the features of the samples
+        """
+        states, actions = self._split(x)
+
+        return self.combine(self.state_features(states), actions)
+
+    def fit(self, states):
+        """
+        Fit the state features. Subclasses must call this method to
+        invalidate the cache.
+        Args:
+            states (np.array): the states
+        """
+        self.clear_cache()
+
+        return self
+
+    def transform(self, states):
+        """
+        Compute the features of the states.
+        Args:
+            states (np.array): the states
+        Returns:
+            the state features
+        """
+        raise NotImplementedError
+
+    def state_features(self, states):
+        """
+        Cached version of transform.
+        Args:
+            states (np.array): the states
+        Returns:
+            the state features
+        """
+        key = _array_key(states)
+        if key in self._cache:
+            features = self._cache.pop(key)
+        else:
+            features = self.transform(states)
+        self._cache[key] = features
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return features
+
+    def combine(self, state_features, actions):
+        """
+        Append the actions to the state features.
+        Args:
+            state_features (np.array): the state features
+            actions (np.array): the actions
+        Returns:
+            the features of the samples
+        """
+        actions = actions.reshape(-1, self.action_dim)
+        if sp.issparse(state_features):
+            return sp.hstack((state_features, sp.csr_matrix(actions)),
+                             format='csr')
+
+        return np.concatenate((state_features, actions), axis=1)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def __getstate__(self):
+        # the cache is not pickled, as it keeps the (large) features of the
+        # states it has been filled with
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+
+        return state
+
+    def _split(self, X):
+        return X[:, :-self.action_dim], X[:, -self.action_dim:]
+
+
+class PolyFeatures(Features):
+    def __init__(self, degree, action_dim=1, cache_size=4):
+        self.degree = degree
+        self.poly = PolynomialFeatures(self.degree)
+        super(PolyFeatures, self).__init__(action_dim, cache_size)
+
+    def fit(self, states):
+        self.poly.fit(states)
+
+        return super(PolyFeatures, self).fit(states)
+
+    def transform(self, states):
+        return self.poly.transform(states)
+
+
+class _BoxFeatures(Features):
+    """
+    Base class of the features defined on a box of the state space. The
+    bounds not given are taken from the states the features are fitted on.
+    """
+
+    def __init__(self, low=None, high=None, action_dim=1, cache_size=4):
+        self.low = low
+        self.high = high
+        super(_BoxFeatures, self).__init__(action_dim, cache_size)
+
+    def fit(self, states):
+        low = states.min(axis=0) if self.low is None else self.low
+        high = states.max(axis=0) if self.high is None else self.high
+        self._low = np.ones(states.shape[1]) * low
+        self._high = np.maximum(np.ones(states.shape[1]) * high,
+                                self._low + 1e-12)
+
+        return super(_BoxFeatures, self).fit(states)
+
+
+class RBFFeatures(_BoxFeatures):
+    """
+    Gaussian radial basis functions centered on a regular grid. Each basis
+    function is truncated to zero beyond radius widths from its center along
+    any dimension, so that each state activates at most
+    (2 * floor(radius * width) + 1) centers per dimension and the features
+    are a sparse CSR matrix.
+    """
+
+    # number of centers activated by each state with the default radius
+    max_active = 256
+
+    def __init__(self, n_centers, width=1., radius=None, low=None, high=None,
+                 action_dim=1, cache_size=4):
+        """
+        Constructor.
+        Args:
+            n_centers (int, list): number of centers along each dimension
+            width (float, 1.): standard deviation of the gaussians, in units
+                               of grid spacing
+            radius (float, None): truncation radius, in units of width. If
+                                  None, the largest of 3, 2 and 1 such that
+                                  each state activates at most max_active
+                                  centers (1 if none does): with the default
+                                  width, 3 for 1 and 2 dimensions, 2 for 3
+                                  and 1 for 4 to 5
+            low (float, list, None): lower bound of the grid
+            high (float, list, None): upper bound of the grid
+            action_dim (int, 1): action dimensionality
+            cache_size (int, 4): size of the cache of the state features
+        """
+        self.n_centers = n_centers
+        self.width = width
+        self.radius = radius
+        super(RBFFeatures, self).__init__(low, high, action_dim, cache_size)
+
+    def fit(self, states):
+        super(RBFFeatures, self).fit(states)
+        self._shape = (np.ones(states.shape[1], dtype=int) *
+                       self.n_centers).astype(np.intp)
+        self._spacing = (self._high - self._low) / np.maximum(
+            self._shape - 1, 1)
+        self._radius = self.radius
+        if self._radius is None:
+            for radius in (3., 2., 1.):
+                self._radius = radius
+                window = 2 * int(np.floor(radius * self.width)) + 1
+                if np.prod(np.minimum(window, self._shape)) <= \
+                        self.max_active:
+                    break
+
+        return self
+
+    def transform(self, states):
+        n_samples, state_dim = states.shape
+        # position of the states on the grid
+        grid = (states - self._low) / self._spacing
+        reach = int(np.floor(self._radius * self.width))
+        offsets = np.arange(-reach, reach + 1)
+
+        # index and value of the candidate centers along each dimension
+        # Dimensions: n_samples x state_dim x window
+        nearest = np.rint(grid).astype(np.intp)
+        idx = nearest[:, :, np.newaxis] + offsets
+        dist = (grid[:, :, np.newaxis] - idx) / self.width
+        active = (idx >= 0) & (idx < self._shape[:, np.newaxis]) & \
+            (np.abs(dist) <= self._radius)
+        values = np.exp(-0.5 * dist ** 2)
+
+        # the non-zero entries, extended with the active centers of one
+        # dimension at a time; they stay sorted by row and column
+        rows = np.arange(n_samples)
+        columns = np.zeros(n_samples, dtype=np.intp)
+        data = np.ones(n_samples)
+        for d in range(state_dim):
+            entry, k = np.nonzero(active[rows, d])
+            rows = rows[entry]
+            columns = columns[entry] * self._shape[d] + idx[rows, d, k]
+            data = data[entry] * values[rows, d, k]
+        indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(rows, minlength=n_samples))))
+
+        return sp.csr_matrix((data, columns, indptr),
+                             shape=(n_samples, np.prod(self._shape)))
+
+
+class RandomFourierFeatures(Features):
+    """
+    Random Fourier features approximating a gaussian kernel of the given
+    bandwidth. Their number does not depend on the state dimensionality; as
+    every feature is non-zero on every state they are dense.
+    """
+
+    def __init__(self, n_components, bandwidth=1., random_state=None,
+                 action_dim=1, cache_size=4):
+        """
+        Constructor.
+        Args:
+            n_components (int): number of features
+            bandwidth (float, 1.): bandwidth of the approximated kernel
+            random_state (int, None): seed of the random frequencies
+            action_dim (int, 1): action dimensionality
+            cache_size (int, 4): size of the cache of the state features
+        """
+        self.n_components = n_components
+        self.bandwidth = bandwidth
+        self.random_state = random_state
+        super(RandomFourierFeatures, self).__init__(action_dim, cache_size)
+
+    def fit(self, states):
+        rng = np.random.RandomState(self.random_state)
+        self._weights = rng.normal(scale=1. / self.bandwidth,
+                                   size=(states.shape[1], self.n_components))
+        self._offsets = rng.uniform(0, 2 * np.pi, size=self.n_components)
+
+        return super(RandomFourierFeatures, self).fit(states)
+
+    def transform(self, states):
+        return np.sqrt(2. / self.n_components) * np.cos(
+            states.dot(self._weights) + self._offsets)
+
+
+class TileCoding(_BoxFeatures):
+    """
+    Tile coding: n_tilings grids of n_tiles tiles per dimension, each shifted
+    by a random fraction of a tile. Each state activates exactly one tile per
+    tiling, so the features are a sparse binary CSR matrix.
+    """
+
+    def __init__(self, n_tilings, n_tiles, low=None, high=None,
+                 random_state=None, action_dim=1, cache_size=4):
+        """
+        Constructor.
+        Args:
+            n_tilings (int): number of tilings
+            n_tiles (int, list): number of tiles along each dimension
+            low (float, list, None): lower bound of the tiled box
+            high (float, list, None): upper bound of the tiled box
+            random_state (int, None): seed of the random shifts
+            action_dim (int, 1): action dimensionality
+            cache_size (int, 4): size of the cache of the state features
+        """
+        self.n_tilings = n_tilings
+        self.n_tiles = n_tiles
+        self.random_state = random_state
+        super(TileCoding, self).__init__(low, high, action_dim, cache_size)
+
+    def fit(self, states):
+        super(TileCoding, self).fit(states)
+        n_tiles = np.ones(states.shape[1], dtype=int) * self.n_tiles
+        self._width = (self._high - self._low) / n_tiles
+        # shifted tilings need one more tile to cover the box
+        self._shape = (n_tiles + 1).astype(np.intp)
+        rng = np.random.RandomState(self.random_state)
+        self._shifts = rng.uniform(size=(self.n_tilings, states.shape[1]))
+
+        return self
+
+    def transform(self, states):
+        n_samples = states.shape[0]
+        tiles_per_tiling = np.prod(self._shape)
+        # Dimensions: n_samples x n_tilings x state_dim
+        coords = ((states[:, np.newaxis, :] - self._low) / self._width +
+                  self._shifts).astype(np.intp)
+        coords = np.clip(coords, 0, self._shape - 1)
+        columns = np.ravel_multi_index(
+            tuple(np.moveaxis(coords, 2, 0)), self._shape) + \
+            np.arange(self.n_tilings) * tiles_per_tiling
+
+        return _to_csr(np.ones(columns.shape), columns,
+                       self.n_tilings * tiles_per_tiling)
+
+
+def _to_csr(data, columns, n_columns):
+    """
+    Build a CSR matrix with the same number of candidate entries in each row,
+    dropping the zero ones.
+    """
+    n_samples, n_entries = columns.shape
+    keep = data.ravel() != 0
+    indptr = np.concatenate(
+        ([0], np.cumsum((data != 0).sum(axis=1))))
+    X = sp.csr_matrix((data.ravel()[keep], columns.ravel()[keep], indptr),
+                      shape=(n_samples, n_columns))
+    X.sort_indices()
+
+    return X
+
+
+def _array_key(X):
+    """
+    Key of the content of an array: arrays modified in place or allocated
+    at the memory of a freed one get a different key.
+    """
+    X = np.ascontiguousarray(X)
+
+    return X.shape, X.dtype.str, hashlib.sha1(X.view(np.uint8)).hexdigest()